@@ -1,18 +1,12 @@
-from scipy.signal import correlate
-import numpy
 from matplotlib import pyplot as plt
 
-from common import gamefile
+from common import gamefile, dt
 from analyze_csv import analyzeCSV
+from lag_analysis import lag_table, windowed_lag_table, plot_lags
 
 if __name__ == '__main__':
     df = analyzeCSV(gamefile('Jet_Hangar_Test.AttitudeControl.csv'),
-                   ['err_X', 'err_Y', 'err_Z',
-                    'atPID_X', 'atPID_Y', 'atPID_Z',
-                    'avEr_X', 'avEr_Y', 'avEr_Z',
-                    'av_X', 'av_Y', 'av_Z',
-                    'aa_X', 'aa_Y', 'aa_Z',
-                    'pitch', 'roll', 'yaw',],
+                   'AttitudeControl-axes',
                    ['err_X',
                     'aa_X',
                     'av_X',
@@ -21,12 +15,11 @@ if __name__ == '__main__':
                     # region=(2000,)
                    )
 
-    # nsamples = len(df.av_X)
-    # xcorr = correlate(df.MaxAA_X, df.pitch)[nsamples-1:]
-    # dt = numpy.arange(nsamples)
-    #
-    # plt.plot(dt, xcorr)
-    # plt.show()
-    #
-    # recovered_time_shift = dt[xcorr.argmax()]
-    # print "time shift: %d" % (recovered_time_shift)
+    # the axes log has no UT or hV: it is written every physics frame,
+    # so L is the frame number
+    df['UT'] = df.L * dt
+    pairs = [(c, 'pitch') for c in ('err_X', 'aa_X', 'av_X', 'avEr_X')]
+    print(lag_table(df, pairs=pairs, max_lag=5.0).to_string())
+    lags = windowed_lag_table(df, pairs=pairs, window=30.0, max_lag=5.0)
+    plot_lags(lags)
+    plt.show()
@@ -4,14 +4,10 @@ import pandas as pd
 import matplotlib.pyplot as plt
 
 from common import gamefile
+from telemetry_schema import load
 
 if __name__ == '__main__':
-    df = pd.read_csv(gamefile('Tardigrade.AttitudeControl.csv'),
-                              names=('axis', 'throttle',
-                                     'AAx','AAy','AAz',
-                                     'ODx', 'ODy', 'ODz',
-                                     'kDx', 'kDy', 'kDz',
-                                     'AAf'))
+    df = load(gamefile('Tardigrade.AttitudeControl.csv'), 'AAf-curve')
 
     print(df.to_string())
     
@@ -4,8 +4,6 @@ Created on Jan 8, 2015
 @author: Allis Tauri
 """
 
-from collections import deque
-
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.lines as mlines
@@ -13,6 +11,14 @@ import os
 
 from common import clamp, clamp01, clampH, clampL, lerp, dt, plt_show_maxed, vec, vec6, xzy, PID, PID2, color_grad, legend
 from analyze_csv import loadCSV, addL
+from streaming_stats import StreamingStats
+from telemetry_schema import load as load_log
+from torque_allocation import optR_batch, random_demands, plot_batch
+from kepler import propagate
+from oscillation import OscillationDetector, search_params
+from geodesy import dms, bearing, point_between, cross_track
+from point_nav import simulate_approach
+from braking import ttb, burn_distance, braking_distance
 
 
 def draw_vectors(*vecs):
@@ -241,25 +247,10 @@ class VSF_sim(object):
     #               % (upV, self.K1, self.L1, self.K2, self.L2, sum(self.F)))
 
     def describe(self):
-        from scipy import stats
         cols = ('X', 'rX', 'V', 'rV', 'Vsp', 'dVsp', 'K')
-        for n in cols:
-            c = getattr(self, n)
-            d = stats.describe(c)
-            print '%s:' % n
-            print '   sum:    ', sum(c)
-            print '   min-max:', d.minmax
-            print '   mean:   ', d.mean
-            print '   median: ', np.median(c)
-            print '   std:    ', np.std(c)
-            print '   sem:    ', stats.sem(c)
-            print '   skew:   ', d.skewness
-            print '   hist:   '
-            h = np.histogram(c, normed=True)
-            for i, e in enumerate(h[1][1:]):
-                e0 = h[1][i]
-                print '[% 8.3f : % 8.3f]: %s' % (e0, e, "#" * int(h[0][i] * 80))
-            print ''
+        st = StreamingStats(cols)
+        st.update(np.column_stack([getattr(self, n) for n in cols]))
+        print st.report()
         print '\n'
 
     def _plot(self, r, c, n, Y, ylab):
@@ -588,6 +579,17 @@ def sim_Attitude():
 #     plt.show()
 
 
+def sim_Attitude_batch(num=10000, processes=4):
+    demands = random_demands(num, 100.0, seed=42)
+    for name, craft, vK, eps, maxI in (('Uneven_Test', Uneven_Test, 0.5, 0.1, 30),
+                                       ('Shuttle_Test', Shuttle_Test, 0.8, 0.01, 50)):
+        res = optR_batch(craft, demands, vK=vK, eps=eps, maxI=maxI, processes=processes)
+        print name
+        print res
+        print '=' * 80 + '\n'
+        plot_batch(res, name)
+
+
 def linalg_Attitude():
     def engines2a(engines):
         num_e = len(engines)
@@ -805,8 +807,7 @@ def vFilter(v, flt, **kwargs):
 
 
 def simFilters():
-    df = loadCSV('VS-filtering-34.csv', (
-    'AbsAlt', 'TerAlt', 'Alt', 'AltAhead', 'Err', 'VSP', 'VSF', 'MinVSF', 'aV', 'rV', 'dV', 'mdTWR', 'mTWR', 'hV'))
+    df = load_log('VS-filtering-34.csv', 'VS-filtering')
     df = df[df.Alt > 3].reset_index()
     addL(df)
     L = df.L
@@ -829,169 +830,89 @@ def simFilters():
 
 
 def simGC():
-    import math as m
-
-    class angle(object):
-        def __init__(self, d=0, m=0, s=0):
-            self.deg = d + m / 60.0 + s / 3600.0
-            self.rad = self.deg / 180.0 * np.pi
-
-        def _update(self):
-            self.deg = self.rad / m.pi * 180.0
-
-        @classmethod
-        def from_rad(cls, rad):
-            a = angle()
-            a.rad = rad
-            a._update()
-            return a
-
-        def __float__(self): return self.rad
-
-        def __str__(self, *args, **kwargs):
-            return '%fd' % self.deg
-
-        def __add__(self, a):
-            a1 = self.from_rad(self.rad + a.rad)
-            return a1
-
-        def __sub__(self, a):
-            a1 = self.from_rad(self.rad - a.rad)
-            return a1
-
-        def __mul__(self, r):
-            a1 = self.from_rad(self.rad * r)
-            return a1
-
-    class point(object):
-        def __init__(self, lat, lon):
-            self.lat = lat
-            self.lon = lon
-
-        def __str__(self, *args, **kwargs):
-            return 'lat: %s, lon: %s' % (self.lat, self.lon)
-
-    def bearing(p1, p2):
-        cos_lat2 = m.cos(p2.lat)
-        dlon = p2.lon - p1.lon
-        y = m.sin(dlon) * cos_lat2
-        x = m.cos(p1.lat) * m.sin(p2.lat) - m.sin(p1.lat) * cos_lat2 * m.cos(dlon)
-        return m.atan2(y, x)
-
-    def point_between(p1, p2, dist):
-        b = bearing(p1, p2)
-        sin_dist = m.sin(dist)
-        cos_dist = m.cos(dist)
-        sin_lat1 = m.sin(p1.lat)
-        cos_lat1 = m.cos(p1.lat)
-        lat2 = m.asin(sin_lat1 * cos_dist + cos_lat1 * sin_dist * m.cos(b))
-        dlon2 = m.atan2(m.sin(b) * sin_dist * cos_lat1, cos_dist - sin_lat1 * m.sin(lat2))
-        return point(angle.from_rad(lat2),
-                     angle.from_rad(p1.lon.rad + dlon2))
-
-    p1 = point(angle(1, 12, 13), angle(284, 30, 41))
-    p2 = point(angle(5, 22, 20), angle(254, 58, 00))
+    lat1, lon1 = dms(1, 12, 13), dms(284, 30, 41)
+    lat2, lon2 = dms(5, 22, 20), dms(254, 58, 00)
 
     r = 600000.0
     v = 100.0
 
-    t = 0
     dt = 0.01
-    pt = p1
-    pa = p1
-    while t < 2000:
-        da = v * dt / r
-        pt = point_between(pt, p2, da)
-        ba = angle.from_rad(bearing(pa, p2))
-        pa = point(pa.lat + angle.from_rad(da * m.cos(ba)), pa.lon + angle.from_rad(da * m.sin(ba)))
-        t += dt
-
-    print p1
-    print pt
-    print pa
-    print (pa.lat - pt.lat).rad * r, (pa.lon - pt.lon).rad * r
-    print p2
-
-
-#     P = [p1]
-#     for d in np.arange(0.01, 0.6, 0.01):
-#         P.append(point_between(p1, p2, d))
-#         print P[-1]
-#     P.append(p2)
-#
-#     lat = [p.lat.deg for p in P]
-#     lon = [p.lon.deg for p in P]
-#
-#     plt.plot(lon, lat, '*')
+    steps = int(round(2000 / dt))
+    da = v * dt / r
+    # following the great circle is a single step
+    t_lat, t_lon = point_between(lat1, lon1, lat2, lon2, da * steps)
+    # stepping lat/lon along the bearing to the target
+    a_lat, a_lon = lat1, lon1
+    for _i in xrange(steps):
+        ba = bearing(a_lat, a_lon, lat2, lon2)
+        a_lat, a_lon = a_lat + da * np.cos(ba), a_lon + da * np.sin(ba)
+
+    print np.degrees([lat1, lon1])
+    print np.degrees([t_lat, t_lon])
+    print np.degrees([a_lat, a_lon])
+    print (a_lat - t_lat) * r, (a_lon - t_lon) * r
+    print 'cross-track error: %f m' % cross_track(a_lat, a_lon, lat1, lon1, lat2, lon2, r)
+    print np.degrees([lat2, lon2])
+
+
+#     lat, lon = path(lat1, lon1, lat2, lon2, 60)
+#     plt.plot(np.degrees(lon), np.degrees(lat), '*')
 #     plt.show()
 
 def sim_PointNav():
-    P = 2
-    D = 0.1
-    AAk = 0.5
-    pid = PID(P, 0, D, 0, 10)
     accel = np.arange(0.1, 1.1, 0.1)
-    distance = 500
-    distanceF = 0.1
+    # sim_PointNav set pid.kp, which PID does not use, so the gain was constant
+    res = simulate_approach(accel, 500, P=2, D=0.1, AAk=0.5, distanceF=0.1, adaptive=False, trace=True)
+    print res
+    tr = res.trace
     cols = color_grad(len(accel))
     for i, a in enumerate(accel):
-        d = [distance]
-        v = [0]
-        act = [0]
-        t = 0
-        A = [0]
-        while d[-1] > 0:
-            pid.kp = P * a / clampL(v[-1], 0.01)
-            act.append(pid.update(d[-1] * distanceF))
-            aa = a * AAk
-
-            if v[-1] < pid.action:
-                if A[-1] < a: A.append(A[-1] + a * AAk * dt)
-                else: A.append(a)
-            elif v[-1] > pid.action:
-                if A[-1] > -a: A.append(A[-1] - a * AAk * dt)
-                else: A.append(-a)
-            elif A[-1] > 0: A.append(A[-1] - a * AAk * dt)
-            elif A[-1] < 0: A.append(A[-1] + a * AAk * dt)
-            else: A.append(0)
-            #             print 'd=% 8.4f, v=% 8.4f, act=% 8.4f, A=% 8.4f' % (d[-1], v[-1], act[-1], A[-1])
-            v.append(v[-1] + A[-1] * dt)
-            d.append(d[-1] - v[-1] * dt)
-            t += dt
-        print 'accel=%.2f, time: %.1fs' % (a, t)
-        print len(d), len(A)
+        print 'accel=%.2f, time: %.1fs, overshoot %.3fm' % (a, res.arrival[i], res.overshoot[i])
         plt.subplot(3, 1, 1)
-        plt.plot(d, v, color=cols[i], label="accel=%.2f" % a)
+        plt.plot(tr['d'][:, i], tr['v'][:, i], color=cols[i], label="accel=%.2f" % a)
         plt.ylabel("V")
         plt.xlabel("distance")
         plt.subplot(3, 1, 2)
-        plt.plot(d, act, color=cols[i], label="accel=%.2f" % a)
+        plt.plot(tr['d'][:, i], tr['act'][:, i], color=cols[i], label="accel=%.2f" % a)
         plt.ylabel("act")
         plt.xlabel("distance")
         plt.subplot(3, 1, 3)
-        plt.plot(d, A, color=cols[i], label="accel=%.2f" % a)
+        plt.plot(tr['d'][:, i], tr['A'][:, i], color=cols[i], label="accel=%.2f" % a)
         plt.ylabel("real accel");
         plt.xlabel("distance")
     plt.legend()
     plt_show_maxed()
 
 
+def tune_PointNav():
+    accel = np.linspace(0.1, 2, 40)[:, None, None]
+    distance = np.linspace(100, 2000, 20)[None, :, None]
+    P = np.linspace(0.5, 4, 20)
+    res = simulate_approach(accel, distance, P=P, D=0.1)
+    print res
+    plt.subplot(2, 1, 1)
+    plt.contourf(P, accel[:, 0, 0], res.arrival.mean(axis=1), 50)
+    plt.colorbar(label='mean arrival time (s)')
+    plt.ylabel('accel')
+    plt.subplot(2, 1, 2)
+    plt.contourf(P, accel[:, 0, 0], res.overshoot.max(axis=1), 50)
+    plt.colorbar(label='max overshoot (m)')
+    plt.ylabel('accel')
+    plt.xlabel('P')
+    plt_show_maxed()
+
+
 def brake_sim():
     V0 = 123.0
     M = 1.
     T = 1.
     mv = 0.001
 
-    def s(t):
-        return V0 * t + T / mv * ((t - M / mv) * np.log((M - mv * t) / M) - t)
-
-    def TTB(dV):
-        return M / mv * (1 - np.exp(-dV * mv / T))
-
-    t1 = TTB(V0)
-    print t1, s(t1), s(t1) / V0 - t1 / 2
+    t1 = ttb(V0, M, T, mv)
+    s1 = braking_distance(V0, M, T, mv)
+    print t1, s1, s1 / V0 - t1 / 2
     time = np.linspace(0, t1, 1000)
-    plt.plot(time, s(time))
+    plt.plot(time, burn_distance(time, V0, M, T, mv))
     plt.show()
 
 
@@ -1120,15 +1041,9 @@ class lambert_solver(object):
         return self.simulate_generic(self.r1, self.V, self.transfer_time, dt)
 
     def simulate_generic(self, r0, v0, end, dt=0.01):
-        t = [0]
-        r = [r0]
-        v = [v0]
-        while t[-1] <= end:
-            cr = r[-1]
-            r.append(cr + v[-1] * dt)
-            v.append(v[-1] - cr * self.mu / abs(cr) ** 3 * dt)
-            t.append(t[-1] + dt)
-        return t, r, v
+        t = np.arange(0, end + dt, dt)
+        r, v = propagate(r0.v, v0.v, t, self.mu)
+        return t, [vec.from_array(x) for x in r], [vec.from_array(x) for x in v]
 
 
 # ==================================================================#
@@ -1216,36 +1131,6 @@ def solver_sim():
     for tt in xrange(700, 3600, 100): analyze_solution(tt)
 
 
-class OscillationDetector(object):
-    def __init__(self, low, high, bins, window):
-        self.bins = bins
-        self.window = window
-        self.low = low * 2 * np.pi
-        self.high = high * 2 * np.pi
-        self.spectrum = np.zeros(bins)
-        self.freqs = np.linspace(self.low, self.high, bins)
-        self._time = deque(maxlen=window)
-        self._samples = deque(maxlen=window)
-
-    def update(self, val, dt):
-        val /= self.window
-        last, t0 = None, None
-        if len(self._samples) >= self.window:
-            last = self._samples.popleft()
-            t0 = self._time.popleft()
-        self._samples.append(val)
-        if not self._time: self._time.append(0)
-        else: self._time.append(self._time[-1] + dt)
-        t = self._time[-1]
-        if last is None:
-            for i in xrange(self.bins):
-                self.spectrum[i] = self.spectrum[i] + val * np.cos(self.freqs[i] * t)
-        else:
-            for i in xrange(self.bins):
-                self.spectrum[i] = self.spectrum[i] + val * np.cos(self.freqs[i] * t) - \
-                                   last * np.cos(self.freqs[i] * t0)
-
-
 def test_OD(low, high, bins, window):
     time = np.arange(0, 10, dt)
     freq = 8
@@ -1253,23 +1138,14 @@ def test_OD(low, high, bins, window):
         # +np.sin(time*freq*2.354*2*np.pi)*0.3
     # signal = np.ones(time.shape[0])
     od = OscillationDetector(low, high, bins, window)
-    for s in signal: od.update(s, dt)
+    od.process(signal, dt)
     plt.plot(od.freqs / 2 / np.pi, np.abs(od.spectrum))
     plt.show()
 
 
-def find_OD_params(bmin, bmax, low, high, window, dts):
-    all_bins = range(bmin, bmax)
-    peaks = dict.fromkeys(all_bins, 0.0)
-    for dt in dts:
-        time = np.arange(0, 10, dt)
-        signal = np.ones(time.shape[0])
-        for bins in all_bins:
-            od = OscillationDetector(low, high, bins, window)
-            for s in signal: od.update(s, dt)
-            peaks[bins] += np.max(np.abs(od.spectrum))
-    for pair in sorted(peaks.items(), key=lambda p: p[1], reverse=True):
-        print pair
+def find_OD_params(bmin, bmax, low, high, window, dts, processes=4):
+    result = search_params([low], [high], range(bmin, bmax), [window], dts, processes=processes)
+    print result
 
 
 if __name__ == '__main__':
@@ -1319,6 +1195,7 @@ if __name__ == '__main__':
 #     sim_VS_Stability()
 #     sim_Altitude()
 #     sim_Attitude()
+#     sim_Attitude_batch()
 #     sim_Rotation()
 #     simFilters()
 #     simGC()
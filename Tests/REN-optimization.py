@@ -11,10 +11,11 @@ from matplotlib.path import Path
 
 from itertools import combinations
 
+from telemetry_schema import load
+
 def plot_search_paths(N, filename = 'CDOS_test.csv', num_paths = 3):
     os.chdir('/home/storage/Games/KSP_linux/PluginsArchives/Development/AT_KSP_Plugins/KSP-test/KSP_test_1.2.2/')
-    df = pd.read_csv(filename,
-                     names=['tag', 'startT', 'transfer', 'dist', 'dir_x', 'dir_y', 'dDist', 'feasible', 'time'])
+    df = load(filename, 'CDOS-search')
     # get samples
     starts = df[df['tag'] == 'initial point'].index.tolist()
     samples = []
@@ -60,23 +61,7 @@ def center_angle(a):
 
 def plot_dV_PCA():
     os.chdir('/home/storage/Games/KSP_linux/PluginsArchives/Development/AT_KSP_Plugins/KSP-test/KSP_test_1.2.2')
-    names = ['cdos_dV', 'cdos_d', 'cdos_time',
-             'correction', 'correction_time',
-             'cdos_ttr', 'cdos_ttr_end', 'cdos_ttr_d', 'cdos_ttr_time',
-             'old', 'old_end', 'old_d', 'old_time',
-             'correction_dV_diff', 'old_dV_diff',
-             'incl',
-             'PeR', 'ApR',
-             'PeA_angle_before', 'PeA_angle_after',
-             'ttr_before', 'ttr_after',
-             'res_before', 'res_after',
-             'signed_ttr_after',
-             'periodT', 'periodV_before', 'periodV_after',
-             'eccV_before', 'eccV_after', 'eccT',
-             'enV_before', 'enV_after', 'enT',
-             'ttr_up',  'ttr_async',
-             'time']
-    df = pd.read_csv('CDOS_dV.csv', names=names)
+    df = load('CDOS_dV.csv', 'CDOS-dV')
     # get samples
     # df = df.iloc[:35,:]
     df = df.loc[df.correction > 0.1]
@@ -8,18 +8,136 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.lines as mlines
 import pandas as pd
+import hashlib
 import os
 
-from common import plt_show_maxed, color_grad
+from common import plt_show_maxed, color_grad, dt
+from streaming_stats import StreamingStats
+from downsample import DownsampledLine, minmax
 
 
-def loadCSV(filename, columns=None, header=None):
-    os.chdir(os.path.join(os.environ['HOME'], 'ThrottleControlledAvionics'))
-    df = pd.read_csv(filename, header=header, names=columns)
-    return df
+datadir = os.path.join(os.environ.get('HOME', ''), 'ThrottleControlledAvionics')
+
+# columns that are not numeric in the telemetry logs
+text_columns = ('name', 'tag')
+
+# columns that need double precision whatever the requested dtype
+time_columns = ('UT', 'time')
+
+
+def datafile(filename):
+    """
+    :return: absolute path of a telemetry file; relative paths that do
+    not exist in the working directory are taken relative to datadir
+    """
+    if os.path.isabs(filename) or os.path.exists(filename):
+        return os.path.abspath(filename)
+    return os.path.join(datadir, filename)
+
+
+def column_dtypes(columns, dtype):
+    """
+    :param dtype: None, a dtype for all the numeric columns or a dict of column dtypes
+    :return: dtype argument for pandas.read_csv
+    """
+    if dtype is None or isinstance(dtype, dict) or columns is None:
+        return dtype
+    return dict((c, np.float64 if c in time_columns else dtype)
+                for c in columns if c not in text_columns)
+
+
+# directory of the Parquet copies of the loaded CSV files
+cachedir = os.path.join(os.environ.get('HOME', ''), '.cache', 'analyze_csv')
+
+
+def _sha(value):
+    return hashlib.sha1(repr(value).encode('utf8')).hexdigest()[:12]
+
+
+def _cache_prefix(path):
+    """:return: the common prefix of the names of all the cached copies of a file"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return '%s.%s.' % (name, _sha(path))
+
+
+def _cache_version(path):
+    st = os.stat(path)
+    return _sha((st.st_size, st.st_mtime))
+
+
+def _cache_file(path, columns, header, dtypes, kind='parquet'):
+    key = (header, None if columns is None else list(columns),
+           None if dtypes is None else sorted((k, str(np.dtype(v))) for k, v in dtypes.items()))
+    return os.path.join(cachedir, '%s%s.%s.%s' % (_cache_prefix(path), _cache_version(path), _sha(key), kind))
 
 
-def drawDF(df, x, columns, colors=None, axes=None):
+def _write_cache(df, path, cfile, **kwargs):
+    """
+    Writes the cached copy of the file through a temporary file,
+    then removes the copies of the older versions of the file.
+    :param kwargs: passed to DataFrame.to_parquet
+    """
+    if not os.path.isdir(cachedir): os.makedirs(cachedir)
+    tmp = '%s.%d.tmp' % (cfile, os.getpid())
+    try:
+        df.to_parquet(tmp, **kwargs)
+        os.rename(tmp, cfile)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+    prefix = _cache_prefix(path)
+    current = prefix + _cache_version(path) + '.'
+    for name in os.listdir(cachedir):
+        if name.startswith(prefix) and not name.startswith(current):
+            try: os.remove(os.path.join(cachedir, name))
+            except OSError: pass
+
+
+def _cached_read(path, columns, header, usecols, dtypes):
+    """
+    Reads the CSV file through its Parquet copy, which is keyed by the path,
+    size and modification time of the file and by the columns and dtypes.
+    The copy holds all the columns; usecols are projected on load.
+    """
+    cfile = _cache_file(path, columns, header, dtypes)
+    if os.path.isfile(cfile):
+        return pd.read_parquet(cfile, columns=usecols)
+    df = pd.read_csv(path, header=header, names=columns, dtype=dtypes)
+    if all(isinstance(c, str) for c in df.columns):
+        try: _write_cache(df, path, cfile)
+        except ImportError: pass
+    return df[usecols] if usecols is not None else df
+
+
+def loadCSV(filename, columns=None, header=None, usecols=None, dtype=None, chunksize=None, cache=False):
+    """
+    :param columns: names of all the columns of the file
+    :param usecols: names of the columns to load; all by default
+    :param dtype: dtype of the numeric columns (e.g. np.float32) or a dict of column dtypes
+    :param chunksize: if given, return an iterator over DataFrames of that many rows
+    :param cache: if True, load through a Parquet copy of the file kept in cachedir;
+    not used with chunksize
+    Binary logs (see binary_log) are read from their memory map;
+    their columns and dtypes are those in the file.
+    """
+    from binary_log import BinaryLog, is_binary
+    if usecols is not None: usecols = list(usecols)
+    path = datafile(filename)
+    if is_binary(path):
+        log = BinaryLog(path)
+        return log.to_frame(usecols) if chunksize is None else log.chunks(chunksize, usecols)
+    if cache and chunksize is None:
+        return _cached_read(path, columns, header, usecols, column_dtypes(columns, dtype))
+    dtypes = column_dtypes(usecols or columns, dtype)
+    return pd.read_csv(path, header=header, names=columns,
+                       usecols=usecols, dtype=dtypes, chunksize=chunksize)
+
+
+def drawDF(df, x, columns, colors=None, axes=None, method='minmax', points=None):
+    """
+    :param method: downsampling of the series: 'minmax', 'lttb' or None to plot every sample;
+    the downsampled lines re-fetch the detail when zoomed
+    :param points: resolution of the downsampling; the width of the axes in pixels by default
+    """
     from collections import Counter
     if axes is not None:
         num_axes = Counter(axes)
@@ -29,13 +147,13 @@ def drawDF(df, x, columns, colors=None, axes=None):
     ax1 = None
     if colors is None: colors = color_grad(len(columns))
     for i, k in enumerate(columns):
-        if axes is None:
-            plt.plot(X, df[k], label=k, color=colors[i])
+        if axes is None: ax = plt.gca()
         else:
             ax = plt.subplot(nrows, ncols, ncols * (i % nrows) + axes[i], sharex=ax1)
-            ax.plot(X, df[k], label=k, color=colors[i])
             plt.ylabel(k)
             if ax1 is None: ax1 = ax
+        if method is None: ax.plot(X, df[k], label=k, color=colors[i])
+        else: DownsampledLine(ax, X.values, df[k].values, method, points, label=k, color=colors[i])
         plt.minorticks_on()
         plt.grid(b=False, which='major', axis='x', color='b', linestyle='-')
         plt.grid(b=False, which='minor', axis='x', color='0.15', linestyle='--')
@@ -51,59 +169,215 @@ def boxplot(df, columns=None):
 
 
 def describe(df, columns=None):
-    from scipy import stats
-    cnames = df.keys() if columns is None else columns
-    for k in cnames:
-        c = df[k]
-        d = stats.describe(c)
-        print '%s:' % k
-        print '   len:    ', len(c)
-        print '   sum:    ', sum(c)
-        print '   min-max:', d.minmax
-        print '   mean:   ', d.mean
-        print '   median: ', np.median(c)
-        print '   std:    ', np.std(c)
-        print '   sem:    ', stats.sem(c)
-        print '   skew:   ', d.skewness
-        print '   hist:   '
-        h = np.histogram(c, normed=True)
-        for i, e in enumerate(h[1][1:]):
-            e0 = h[1][i]
-            print '[% 8.3f : % 8.3f]: %s' % (e0, e, "#" * int(h[0][i] * 80))
-        print ''
+    """
+    :param df: DataFrame or an iterable of DataFrames (e.g. loadCSV with chunksize);
+    the statistics are computed in one pass over the chunks
+    """
+    st = StreamingStats.from_chunks(df, columns)
+    print st.report()
     print '\n'
 
 
-def addL(df):
-    """add horizontal coordinate column"""
-    L = [0]
-    if 'hV' in df:
-        for hv in df.hV[:-1]:
-            L.append(L[-1] + hv * dt)
+def addL(df, dt=dt):
+    """
+    Add horizontal coordinate column: the integral of hV over the UT column,
+    or over the constant dt if there is no UT; the row number if there is no hV.
+    """
+    if 'hV' in df and len(df):
+        L = np.zeros(len(df))
+        steps = np.diff(df.UT.values) if 'UT' in df else dt
+        np.cumsum(df.hV.values[:-1] * steps, out=L[1:])
     else:
         L = np.arange(0, df.shape[0], 1)
     df['L'] = pd.Series(L, index=df.index)
 
 
-def analyzeCSV(filename, header, cols=None, x=None, axes=(), region=None):
-    df = loadCSV(filename, header)
+def appendL(df, rows, dt=dt):
+    """
+    Append rows to a DataFrame with the L column computed by addL,
+    continuing L without recomputing it for the existing rows.
+    :return: the new DataFrame
+    """
+    rows = rows.copy()
+    if not len(df):
+        addL(rows, dt)
+        return rows.reset_index(drop=True)
+    if 'hV' in df:
+        last = df.iloc[-1]
+        if 'UT' in rows:
+            steps = np.diff(np.concatenate([[last.UT], rows.UT.values]))
+        else: steps = np.full(len(rows), dt)
+        hV = np.concatenate([[last.hV], rows.hV.values[:-1]])
+        rows['L'] = last.L + np.cumsum(hV * steps)
+    else:
+        # df may be the trimmed tail of a longer log
+        rows['L'] = df.L.iloc[-1] + 1 + np.arange(rows.shape[0])
+    return pd.concat([df, rows], ignore_index=True)
+
+
+def sliceL(df, start=None, end=None):
+    """
+    :return: rows with start < L <= end; binary search when L is sorted,
+    which it is for non-negative hV
+    """
+    L = df.L
+    if L.is_monotonic_increasing:
+        i = 0 if start is None else L.searchsorted(start, side='right')
+        j = len(L) if end is None else L.searchsorted(end, side='right')
+        return df.iloc[i:j]
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None: mask &= L.values > start
+    if end is not None: mask &= L.values <= end
+    return df[mask]
+
+
+def _clean(df):
     if 'name' in df:
         del df['name']
-        df.reset_index()
     if 'AltitudeAhead' in df:
-        df.AltitudeAhead[df.AltitudeAhead > 10000] = 0
+        df.loc[df.AltitudeAhead > 10000, 'AltitudeAhead'] = 0
     if 'Alt' in df:
         df = df[df.Alt > 3].reset_index()
+    return df
+
+
+def _usecols(header, cols, x):
+    if cols is None: return None
+    # only the plotted columns and the ones used for filtering
+    needed = set(cols) | set([x, 'name', 'Alt', 'AltitudeAhead', 'UT', 'hV'])
+    return [c for c in header if c in needed]
+
+
+def _prepare(df):
+    """Cleans a loaded log, makes UT relative to its start and adds L"""
+    df = _clean(df)
     if 'UT' in df:
         df['UT'] -= df.UT[0]
     addL(df)
-    # slice by L
+    return df
+
+
+# rows per row group of the indexed copies: about 80 s of 50 Hz telemetry
+index_block = 4096
+
+# columns whose ranges in the row groups are used by the region queries
+index_columns = ('UT', 'L', 'Alt')
+
+
+class LogIndex(object):
+    """
+    Region queries over the indexed Parquet copy of a prepared log.
+    The copy is written in row groups of index_block rows; the min/max
+    statistics Parquet keeps for every row group select the groups that
+    overlap a region, and only those are read.
+    """
+
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+        self.file = pq.ParquetFile(path)
+        self.columns = self.file.schema_arrow.names
+        meta = self.file.metadata
+        self.ranges = {}
+        for i in range(meta.num_row_groups):
+            rg = meta.row_group(i)
+            for j in range(rg.num_columns):
+                col = rg.column(j)
+                if col.path_in_schema not in index_columns: continue
+                st = col.statistics
+                rng = (st.min, st.max) if st is not None and st.has_min_max else (-np.inf, np.inf)
+                self.ranges.setdefault(col.path_in_schema, []).append(rng)
+        self.ranges = dict((c, np.array(r, dtype=float).reshape(-1, 2)) for c, r in self.ranges.items())
+
+    def __len__(self): return self.file.metadata.num_rows
+
+    def groups(self, column, start=None, end=None):
+        """:return: indices of the row groups that may have rows with start < column <= end"""
+        lo, hi = self.ranges[column].T
+        keep = np.ones(len(lo), dtype=bool)
+        if start is not None: keep &= hi > start
+        if end is not None: keep &= lo <= end
+        return np.nonzero(keep)[0]
+
+    def read(self, column, start=None, end=None, usecols=None):
+        """
+        :param column: one of the index_columns
+        :param usecols: columns to load; all by default
+        :return: DataFrame of the rows with start < column <= end
+        """
+        if usecols is not None:
+            usecols = [c for c in self.columns if c in set(usecols) | set([column])]
+        groups = self.groups(column, start, end)
+        df = self.file.read_row_groups(groups, columns=usecols).to_pandas()
+        if start is None and end is None: return df
+        v = df[column].values
+        mask = np.ones(len(df), dtype=bool)
+        if start is not None: mask &= v > start
+        if end is not None: mask &= v <= end
+        return df[mask].reset_index(drop=True)
+
+
+def indexCSV(filename, header, dtype=None):
+    """
+    Writes the indexed copy of the prepared log to cachedir on the first call.
+    :return: LogIndex of the copy or None if Parquet is not available
+    """
+    path = datafile(filename)
+    ifile = _cache_file(path, header, None, column_dtypes(header, dtype), 'indexed.parquet')
+    try:
+        if not os.path.isfile(ifile):
+            df = _prepare(loadCSV(path, header, dtype=dtype))
+            _write_cache(df, path, ifile, index=False, row_group_size=index_block)
+        return LogIndex(ifile)
+    except ImportError:
+        return None
+
+
+def loadRegion(filename, header, column='UT', start=None, end=None, usecols=None, dtype=None):
+    """
+    Loads the rows of the prepared log with start < column <= end,
+    reading only the row groups of its indexed copy that overlap the region.
+    :param column: one of the index_columns
+    """
+    index = indexCSV(filename, header, dtype)
+    if index is not None:
+        return index.read(column, start, end, usecols)
+    df = _prepare(loadCSV(filename, header, dtype=dtype))
+    if usecols is not None: df = df[[c for c in df.columns if c in set(usecols) | set([column])]]
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None: mask &= df[column].values > start
+    if end is not None: mask &= df[column].values <= end
+    return df[mask].reset_index(drop=True)
+
+
+def analyzeCSV(filename, header=None, cols=None, x=None, axes=(), region=None, dtype=None, cache=False,
+               follow=False, **follow_kwargs):
+    """
+    :param header: column names, a telemetry_schema.Schema, its name
+    or None to detect the schema of the log
+    :param cache: if True, load through the indexed copy of the log (see LogIndex);
+    the copy is a full Parquet copy of the log written to cachedir
+    :param follow: if True, watch the growing log with followCSV instead
+    """
+    if header is None or isinstance(header, basestring) or hasattr(header, 'dtypes'):
+        from telemetry_schema import Schema, detect, schemas
+        schema = detect(filename) if header is None else header if isinstance(header, Schema) else schemas[header]
+        header = schema.columns
+        if dtype is None: dtype = schema.read_csv_kwargs()['dtype']
+    if follow: return followCSV(filename, header, cols, x, dtype=dtype, **follow_kwargs)
     if region:
         region = list(region)
         if len(region) < 2: region.append(None)
         if region[0] == None: region[0] = 0
-        if region[1] == None: region[1] = df.L.last
-        df = df[(df.L > region[0]) & (df.L <= region[1])]
+    usecols = _usecols(header, cols, x)
+    index = indexCSV(filename, header, dtype) if cache else None
+    if index is not None:
+        # only the row groups overlapping the region are read
+        df = index.read('L', *(region or (None, None)),
+                        usecols=None if usecols is None else usecols + ['index', 'L'])
+    else:
+        df = _prepare(loadCSV(filename, header, usecols=usecols, dtype=dtype))
+        # slice by L
+        if region: df = sliceL(df, *region)
     #     print df.iloc[500]
     if cols is None:
         cols = list(df.keys())
@@ -113,6 +387,89 @@ def analyzeCSV(filename, header, cols=None, x=None, axes=(), region=None):
     return df
 
 
+class LogTail(object):
+    """Parses only the complete lines appended to a CSV file since the last read"""
+
+    def __init__(self, filename, columns, usecols=None, dtype=None):
+        self.filename = datafile(filename)
+        self.columns = columns
+        self.usecols = usecols
+        self.dtype = column_dtypes(usecols or columns, dtype)
+        self.offset = 0
+        self._partial = b''
+
+    def read(self):
+        """:return: DataFrame of the new rows or None"""
+        if not os.path.isfile(self.filename): return None
+        size = os.path.getsize(self.filename)
+        if size < self.offset:
+            # the log was truncated or rewritten
+            self.offset = 0
+            self._partial = b''
+        if size == self.offset: return None
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            data = self._partial + f.read(size - self.offset)
+        self.offset = size
+        end = data.rfind(b'\n') + 1
+        self._partial = data[end:]
+        if not end: return None
+        from io import BytesIO
+        return pd.read_csv(BytesIO(data[:end]), header=None, names=self.columns,
+                           usecols=self.usecols, dtype=self.dtype)
+
+
+def followCSV(filename, header, cols=None, x=None, dtype=None, window=10000, fps=5.0, max_idle=None):
+    """
+    Watches a log that is being written: parses only the appended lines,
+    keeps the last window rows, updates the statistics of all the rows
+    and redraws the plots at most fps times a second.
+    Stops when the figure is closed, on Ctrl+C or after max_idle seconds without new rows.
+    :return: the DataFrame of the last window rows and the StreamingStats
+    """
+    import time
+    if cols is not None: cols = list(cols)
+    tail = LogTail(filename, header, _usecols(header, cols, x), dtype)
+    df = None
+    st = None
+    ut0 = None
+    lines = []
+    fig = plt.figure()
+    last_data = time.time()
+    try:
+        while plt.fignum_exists(fig.number):
+            rows = tail.read()
+            if rows is not None and len(rows):
+                rows = _clean(rows)
+                if 'UT' in rows and len(rows):
+                    if ut0 is None: ut0 = rows.UT.values[0]
+                    rows['UT'] -= ut0
+                # L continues across the trimmed rows, so the x axis keeps moving
+                df = appendL(rows.iloc[:0] if df is None else df, rows)
+                df = df.iloc[-window:]
+                if cols is None:
+                    cols = [c for c in df.keys() if c not in ('L', 'index', x)]
+                if st is None: st = StreamingStats(cols)
+                st.update(rows[cols])
+                if not lines:
+                    for i, k in enumerate(cols):
+                        ax = plt.subplot(len(cols), 1, i + 1, sharex=lines[0].axes if lines else None)
+                        lines.append(ax.plot([], [], label=k)[0])
+                        plt.ylabel(k)
+                X = df['L' if x is None else x].values
+                for k, line in zip(cols, lines):
+                    line.set_data(minmax(X, df[k].values, int(line.axes.bbox.width)))
+                    line.axes.relim()
+                    line.axes.autoscale_view()
+                fig.suptitle('%s: %d rows' % (os.path.basename(tail.filename), st.count.max()))
+                last_data = time.time()
+            elif max_idle is not None and time.time() - last_data > max_idle: break
+            plt.pause(1.0 / fps)
+    except KeyboardInterrupt: pass
+    if st is not None: print st.report()
+    return df, st
+
+
 gamedir = u'/home/storage/Games/KSP_linux/PluginsArchives/Development/AT_KSP_Plugins/KSP-test/'
 game = u'KSP_test_1.3'
 
@@ -122,22 +479,7 @@ def gamefile(filename): return os.path.join(gamedir, game, filename)
 if __name__ == '__main__':
     analyzeCSV(
             gamefile('Tardigrade.AttitudeControl.csv'),
-            (
-                'Alt',
-                'Ex', 'Ey', 'Ez',
-                'Sx', 'Sy', 'Sz',
-                'AVx', 'AVy', 'AVz',
-                'AMx', 'AMy', 'AMz',
-                'INx', 'INy', 'INz',
-                'Ax', 'Ay', 'Az',
-                'Px', 'Py', 'Pz',
-                'Ix', 'Iy', 'Iz',
-                'Dx', 'Dy', 'Dz',
-                'AAx', 'AAy', 'AAz',
-                'PIfx', 'PIfy', 'PIfz',
-                'AAfx', 'AAfy', 'AAfz',
-                'SLx', 'SLy', 'SLz',
-            ),
+            'AttitudeControl',
             (
                 'Ex', 'Ey', 'Ez',
                 'Ax', 'Ay', 'Az',
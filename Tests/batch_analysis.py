@@ -0,0 +1,119 @@
+from __future__ import print_function
+import argparse
+import fnmatch
+import glob
+import os
+from multiprocessing import cpu_count
+
+import numpy as np
+import pandas as pd
+
+from telemetry_schema import detect, schemas
+from streaming_stats import StreamingStats
+
+
+def find_logs(paths, pattern='*.csv'):
+    """:return: sorted list of the log files: the files given and the ones matching the pattern in the directories"""
+    files = set()
+    for p in paths:
+        if os.path.isdir(p):
+            for dirpath, _dirs, names in os.walk(p):
+                files.update(os.path.join(dirpath, n) for n in fnmatch.filter(names, pattern))
+        else: files.update(glob.glob(p))
+    return sorted(f for f in files if os.path.isfile(f))
+
+
+def _spectra(df, columns, time='UT', window=30.0):
+    """:return: dominant frequency and amplitude of the strongest window of every column"""
+    from oscillation_analysis import oscillation_table
+    t = df[time].values
+    window = min(window, (t[-1] - t[0]) / 2)
+    table = oscillation_table(df, columns, window=window, time=time)
+    best = table.loc[table.groupby('column').amplitude.idxmax()]
+    return best.set_index('column')[['freq', 'amplitude']]
+
+
+def _plot(df, columns, filename, x=None):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from downsample import minmax
+    fig, axes = plt.subplots(len(columns), 1, sharex=True, squeeze=False,
+                             figsize=(16, 2 * len(columns)))
+    X = df[x].values if x else np.arange(len(df))
+    for ax, c in zip(axes[:, 0], columns):
+        ax.plot(*minmax(X, df[c].values, 2000))
+        ax.set_ylabel(c)
+        ax.grid(True)
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+def analyze_file(args):
+    """
+    Loads and reduces one log.
+    :param args: (filename, schema name or None, columns or None, plots directory or None)
+    :return: list of per-column rows of the summary table
+    """
+    filename, schema, columns, plots = args
+    try:
+        schema = detect(filename) if schema is None else schemas[schema]
+        if columns is not None:
+            columns = [c for u in columns for c in schema.vectors.get(u, [u])]
+        df = schema.load(filename, usecols=None if columns is None else columns + ['UT'])
+        if columns is None: columns = [c for c in df.columns if c not in schema.text]
+        columns = [c for c in columns if c in df and c != 'UT']
+        st = StreamingStats.from_chunks(df, columns)
+        median = st.median
+        spectra = _spectra(df, columns) if 'UT' in df and len(df) > 2 else None
+        rows = []
+        for j, c in enumerate(columns):
+            row = dict(file=filename, schema=schema.name, column=c, rows=int(st.count[j]),
+                       min=st.min[j], max=st.max[j], mean=st.mean[j], median=median[j],
+                       std=st.std[j], skew=st.skewness[j])
+            if spectra is not None and c in spectra.index:
+                row['freq'], row['amplitude'] = spectra.loc[c, 'freq'], spectra.loc[c, 'amplitude']
+            rows.append(row)
+        if plots:
+            name = os.path.splitext(os.path.basename(filename))[0]
+            _plot(df, columns, os.path.join(plots, name + '.png'), 'UT' if 'UT' in df else None)
+        return rows
+    except Exception as e:
+        return [dict(file=filename, error='%s: %s' % (type(e).__name__, e))]
+
+
+def analyze_logs(files, schema=None, columns=None, plots=None, processes=1):
+    """
+    Analyzes the logs on a process pool.
+    :param schema: name of the schema of all the logs; detected for each log if None
+    :param columns: columns to analyze; all the numeric ones if None
+    :param plots: directory for the per-file plots; no plots if None
+    :return: DataFrame with a row per file and column
+    """
+    if plots and not os.path.isdir(plots): os.makedirs(plots)
+    jobs = [(f, schema, columns, plots) for f in files]
+    if processes > 1 and len(jobs) > 1:
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        try: results = pool.map(analyze_file, jobs, chunksize=1)
+        finally: pool.close()
+    else: results = [analyze_file(j) for j in jobs]
+    return pd.DataFrame([row for rows in results for row in rows])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize a directory of telemetry logs in parallel')
+    parser.add_argument('paths', nargs='+', help='log files, globs or directories')
+    parser.add_argument('--pattern', default='*.csv', help='pattern of the logs in the directories')
+    parser.add_argument('--schema', choices=list(schemas), help='schema of the logs; detected if omitted')
+    parser.add_argument('--columns', nargs='*', help='columns or vectors to analyze')
+    parser.add_argument('--plots', help='directory for the per-file plots')
+    parser.add_argument('--processes', type=int, default=cpu_count())
+    parser.add_argument('--output', default='summary.csv', help='the merged summary table')
+    args = parser.parse_args()
+    files = find_logs(args.paths, args.pattern)
+    print('%d logs' % len(files))
+    summary = analyze_logs(files, args.schema, args.columns, args.plots, args.processes)
+    summary.to_csv(args.output, index=False)
+    print(summary.to_string())
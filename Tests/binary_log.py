@@ -0,0 +1,176 @@
+from __future__ import print_function
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+from analyze_csv import datafile, time_columns
+
+# extension of the binary telemetry logs
+binary_ext = '.tlog'
+
+magic = b'TCALOG\x00\x01'
+
+# the records start at a multiple of this from the beginning of the file
+alignment = 64
+
+# width of the text fields in bytes; longer values are truncated
+text_width = 32
+
+
+def is_binary(filename):
+    """:return: True if the file is a binary telemetry log"""
+    path = datafile(filename)
+    if not os.path.isfile(path): return path.endswith(binary_ext)
+    with open(path, 'rb') as f:
+        return f.read(len(magic)) == magic
+
+
+def _header(fields, schema):
+    head = json.dumps({'schema': schema, 'fields': fields}).encode('utf8')
+    size = len(magic) + 4 + len(head)
+    return magic + struct.pack('<I', len(head)) + head + b' ' * (-size % alignment)
+
+
+def _fields(chunk, dtype):
+    """:return: little-endian record fields for the columns of a DataFrame"""
+    fields = []
+    for c in chunk.columns:
+        kind = chunk[c].dtype.kind
+        if kind == 'O': t = 'S%d' % text_width
+        elif kind == 'b': t = '|b1'
+        elif kind in 'iu': t = '<i8'
+        elif c in time_columns or dtype is None: t = np.dtype(chunk[c].dtype).newbyteorder('<').str
+        else: t = np.dtype(dtype).newbyteorder('<').str
+        fields.append([c, t])
+    return fields
+
+
+def write(df, filename, schema=None, dtype=None, append=False):
+    """
+    Writes a DataFrame as a binary log, or appends its rows to one.
+    :param schema: name of the telemetry_schema of the log, stored in the header
+    :param dtype: dtype of the float columns but the time ones; as in the DataFrame by default
+    """
+    if append and os.path.isfile(filename):
+        dt = BinaryLog(filename).data.dtype
+        mode = 'ab'
+    else:
+        fields = _fields(df, dtype)
+        dt = np.dtype([(str(n), t) for n, t in fields])
+        mode = 'wb'
+    records = np.empty(len(df), dtype=dt)
+    for c in dt.names:
+        records[c] = df[c].astype(str).str.encode('utf8').values if dt[c].kind == 'S' else df[c].values
+    with open(filename, mode) as f:
+        if mode == 'wb': f.write(_header(fields, schema))
+        records.tofile(f)
+
+
+def convert(filename, output=None, schema=None, dtype=None, chunksize=100000):
+    """
+    Converts a CSV log to the binary format chunk by chunk.
+    :param schema: Schema, its name or None to detect it
+    :param output: the binary file; next to the CSV with binary_ext by default
+    :return: path of the binary file
+    """
+    from telemetry_schema import Schema, detect, schemas
+    path = datafile(filename)
+    if schema is None: schema = detect(path)
+    elif not isinstance(schema, Schema): schema = schemas[schema]
+    if output is None: output = os.path.splitext(path)[0] + binary_ext
+    tmp = '%s.%d.tmp' % (output, os.getpid())
+    append = False
+    try:
+        for chunk in schema.load(path, chunksize=chunksize):
+            write(chunk, tmp, schema.name, dtype, append=append)
+            append = True
+        if not append: write(pd.DataFrame(columns=schema.columns, dtype=float), tmp, schema.name, dtype)
+        os.rename(tmp, output)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+    return output
+
+
+def binary_copy(filename, schema=None, dtype=None):
+    """
+    :return: path of the binary copy of a CSV log, next to it;
+    converted if it does not exist or is older than the CSV
+    """
+    path = datafile(filename)
+    if is_binary(path): return path
+    output = os.path.splitext(path)[0] + binary_ext
+    if not os.path.isfile(output) or os.path.getmtime(output) < os.path.getmtime(path):
+        convert(path, output, schema, dtype)
+    return output
+
+
+class BinaryLog(object):
+    """
+    A binary telemetry log opened as a read-only memory map:
+    columns are views into the file and only the pages that are
+    accessed are read, so opening takes the same time for any size.
+
+    The file is a header -- magic, little-endian uint32 length and JSON with
+    the schema name and the record fields, padded to alignment -- followed by
+    fixed-width little-endian records. A log that is being written is
+    opened up to its last complete record.
+    """
+
+    def __init__(self, filename):
+        self.filename = datafile(filename)
+        with open(self.filename, 'rb') as f:
+            if f.read(len(magic)) != magic:
+                raise ValueError('Not a binary telemetry log: %s' % self.filename)
+            length, = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(length).decode('utf8'))
+        self.schema = header['schema']
+        self.dtype = np.dtype([(str(n), str(t)) for n, t in header['fields']])
+        self.offset = len(magic) + 4 + length
+        self.offset += -self.offset % alignment
+        rows = (os.path.getsize(self.filename) - self.offset) // self.dtype.itemsize
+        if rows > 0:
+            self.data = np.memmap(self.filename, dtype=self.dtype, mode='r', offset=self.offset, shape=(rows,))
+        else: self.data = np.zeros(0, dtype=self.dtype)
+
+    @property
+    def columns(self): return list(self.dtype.names)
+
+    def __len__(self): return len(self.data)
+
+    def __contains__(self, column): return column in self.dtype.names
+
+    def __getitem__(self, column):
+        """:return: the column as a view into the file"""
+        return self.data[column]
+
+    def __repr__(self):
+        return 'BinaryLog(%s, %s, %d rows)' % (os.path.basename(self.filename), self.schema, len(self))
+
+    def to_frame(self, columns=None, start=None, stop=None):
+        """:return: DataFrame with a copy of the rows [start:stop] of the columns"""
+        rows = self.data[start:stop]
+        df = pd.DataFrame(dict((c, rows[c]) for c in (self.columns if columns is None else columns)),
+                          columns=self.columns if columns is None else list(columns))
+        for c in df.columns:
+            if self.dtype[c].kind == 'S': df[c] = df[c].str.decode('utf8')
+        return df
+
+    def chunks(self, chunksize, columns=None):
+        """:return: iterator over DataFrames of chunksize rows"""
+        for start in range(0, len(self), chunksize):
+            yield self.to_frame(columns, start, start + chunksize)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert CSV telemetry logs to the binary format')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--schema', help='schema of the logs; detected if omitted')
+    parser.add_argument('--float32', action='store_true', help='store the non-time float columns as float32')
+    args = parser.parse_args()
+    for f in args.files:
+        out = convert(f, schema=args.schema, dtype=np.float32 if args.float32 else None)
+        print('%s -> %s: %s' % (f, out, BinaryLog(out)))
@@ -0,0 +1,148 @@
+from __future__ import print_function
+import json
+import numpy as np
+
+
+def _small(k):
+    return np.abs(k) < 1e-4
+
+
+def ttb(dV, mass, thrust, mflow):
+    """
+    Time to burn dV with constant thrust and mass flow (Tsiolkovsky).
+    :param dV: delta-V, m/s
+    :param mass: initial mass
+    :param thrust: thrust
+    :param mflow: mass flow, mass per second
+    :return: burn time, s; broadcast over the arguments
+    """
+    dV, mass, thrust, mflow = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (dV, mass, thrust, mflow)])
+    k = dV * mflow / thrust
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = -mass / mflow * np.expm1(-k)
+    return np.where(_small(k), dV * mass / thrust * (1 - k / 2 + k * k / 6), t)
+
+
+def burn_distance(t, V0, mass, thrust, mflow):
+    """
+    Distance covered while braking from V0 for the time t.
+    :return: distance, m; broadcast over the arguments
+    """
+    t, V0, mass, thrust, mflow = np.broadcast_arrays(*[np.asarray(x, dtype=float)
+                                                       for x in (t, V0, mass, thrust, mflow)])
+    q = mflow * t / mass
+    with np.errstate(invalid='ignore', divide='ignore'):
+        s = V0 * t + thrust / mflow * ((t - mass / mflow) * np.log1p(-q) - t)
+    # series of (1 - q) ln(1 - q) + q for small q
+    small = thrust * t * t / mass * (1 / 2.0 + q / 6 + q * q / 12)
+    return np.where(np.abs(q) < 1e-4, V0 * t - small, s)
+
+
+def braking_distance(dV, mass, thrust, mflow):
+    """
+    Distance needed to brake from dV to zero.
+    :return: distance, m; broadcast over the arguments
+    """
+    dV, mass, thrust, mflow = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (dV, mass, thrust, mflow)])
+    k = dV * mflow / thrust
+    with np.errstate(invalid='ignore', divide='ignore'):
+        s = mass * thrust / (mflow * mflow) * (k + np.expm1(-k))
+    return np.where(_small(k), mass * dV * dV / thrust * (1 / 2.0 - k / 6 + k * k / 24), s)
+
+
+class BrakingTable(object):
+    """
+    Precomputed time-to-burn and braking distance over a grid of
+    dV x mass x thrust x mass flow.
+    Both mass-flow factors, ttb / (mass*dV/thrust) and
+    distance / (mass*dV^2/thrust), depend only on k = dV*mflow/thrust,
+    so they are tabulated once over a log-spaced k axis, interpolated
+    linearly in log k and multiplied by the exact constant-mass values
+    on lookup. The 4D factor tables are filled from that interpolation.
+    """
+    axes_names = ('dV', 'mass', 'thrust', 'mflow')
+
+    def __init__(self, dV, mass, thrust, mflow, points=512):
+        """
+        :param dV, mass, thrust, mflow: increasing 1D arrays of the grid axes
+        :param points: number of the nodes of the k axis
+        """
+        self.axes = [np.asarray(a, dtype=float) for a in (dV, mass, thrust, mflow)]
+        kmax = self.axes[0][-1] * self.axes[3][-1] / self.axes[2][0]
+        kmin = max(self.axes[0][0] * self.axes[3][0] / self.axes[2][-1], 1e-6)
+        self.k = np.logspace(np.log10(kmin), np.log10(max(kmax, kmin * 10)), points)
+        self.g, self.h = self.factors(self.k, 1, 1, 1)
+        grid = np.meshgrid(*self.axes, indexing='ij')
+        self.ttb = ttb(*grid)
+        self.distance = braking_distance(*grid)
+        self.ttb_factor, self.distance_factor = self._interpolate(*grid)
+
+    @staticmethod
+    def factors(dV, mass, thrust, mflow):
+        """:return: ttb and distance divided by their constant-mass values"""
+        dV, mass, thrust, mflow = np.broadcast_arrays(*[np.asarray(x, dtype=float)
+                                                        for x in (dV, mass, thrust, mflow)])
+        k = dV * mflow / thrust
+        with np.errstate(invalid='ignore', divide='ignore'):
+            g = -np.expm1(-k) / k
+            h = (k + np.expm1(-k)) / (k * k)
+        small = _small(k)
+        return (np.where(small, 1 - k / 2 + k * k / 6, g),
+                np.where(small, 1 / 2.0 - k / 6 + k * k / 24, h))
+
+    def _interpolate(self, dV, mass, thrust, mflow):
+        """:return: the factors interpolated in log k, clamped to the k axis"""
+        dV, mass, thrust, mflow = np.broadcast_arrays(*[np.asarray(x, dtype=float)
+                                                        for x in (dV, mass, thrust, mflow)])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            lk = np.log(np.clip(dV * mflow / thrust, self.k[0], self.k[-1]))
+        lnk = np.log(self.k)
+        return np.interp(lk, lnk, self.g), np.interp(lk, lnk, self.h)
+
+    def lookup(self, dV, mass, thrust, mflow):
+        """:return: interpolated time-to-burn and braking distance"""
+        point = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (dV, mass, thrust, mflow)])
+        t = point[1] * point[0] / point[2]
+        g, h = self._interpolate(*point)
+        return g * t, h * t * point[0]
+
+    def max_error(self, num=10000, seed=None):
+        """:return: maximum relative errors of the interpolated ttb and distance at random points of the grid"""
+        rnd = np.random.RandomState(seed)
+        point = [rnd.uniform(ax[0], ax[-1], num) for ax in self.axes]
+        t, s = self.lookup(*point)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (np.nanmax(np.abs(t / ttb(*point) - 1)),
+                    np.nanmax(np.abs(s / braking_distance(*point) - 1)))
+
+    def save(self, filename):
+        np.savez(filename, ttb=self.ttb, distance=self.distance,
+                 ttb_factor=self.ttb_factor, distance_factor=self.distance_factor,
+                 k=self.k, g=self.g, h=self.h,
+                 **dict(zip(self.axes_names, self.axes)))
+
+    @classmethod
+    def load(cls, filename):
+        table = cls.__new__(cls)
+        with np.load(filename) as data:
+            table.axes = [data[n] for n in cls.axes_names]
+            table.ttb = data['ttb']
+            table.distance = data['distance']
+            table.ttb_factor = data['ttb_factor']
+            table.distance_factor = data['distance_factor']
+            table.k, table.g, table.h = data['k'], data['g'], data['h']
+        return table
+
+    def export(self, filename):
+        """
+        Writes the table as JSON for the C# code: the axes and the
+        row-major (C order) flattened tables indexed [dV, mass, thrust, mflow],
+        and the 1D factors g (ttb) and h (distance) over the k axis.
+        The factors are to be interpolated linearly in log(dV*mflow/thrust)
+        and multiplied by mass*dV/thrust and mass*dV^2/thrust respectively.
+        """
+        data = dict(zip(self.axes_names, [a.tolist() for a in self.axes]))
+        for name in ('ttb', 'distance', 'ttb_factor', 'distance_factor', 'k', 'g', 'h'):
+            data[name] = getattr(self, name).ravel().tolist()
+        with open(filename, 'w') as f:
+            json.dump(data, f)
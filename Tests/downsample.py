@@ -0,0 +1,93 @@
+from __future__ import print_function
+import numpy as np
+
+
+def minmax(x, y, buckets):
+    """
+    Min/max downsampling: the minimum and the maximum of y
+    in each of the buckets of equal number of samples, in their order.
+    Exact at the pixel level when buckets is the plot width in pixels.
+    :return: downsampled x, y
+    """
+    n = len(y)
+    if n <= 2 * buckets: return x, y
+    size = n // buckets
+    m = size * buckets
+    Y = y[:m].reshape(buckets, size)
+    base = np.arange(buckets) * size
+    with np.errstate(invalid='ignore'):
+        imin = base + np.nanargmin(np.where(np.isnan(Y), np.inf, Y), axis=1)
+        imax = base + np.nanargmax(np.where(np.isnan(Y), -np.inf, Y), axis=1)
+    idx = np.sort(np.concatenate([imin, imax, [n - 1]]))
+    return x[idx], y[idx]
+
+
+def lttb(x, y, points):
+    """
+    Largest-Triangle-Three-Buckets downsampling to the given number of points.
+    :return: downsampled x, y
+    """
+    n = len(y)
+    if n <= points or points < 3: return x, y
+    xf = np.asarray(x, dtype=float)
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    idx = np.empty(points, dtype=int)
+    idx[0] = 0
+    idx[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, stop = edges[i], edges[i + 1]
+        nxt = slice(stop, edges[i + 2] if i + 2 < len(edges) else n)
+        cx, cy = xf[nxt].mean(), y[nxt].mean()
+        ax, ay = xf[a], y[a]
+        area = np.abs((ax - cx) * (y[start:stop] - ay) - (ax - xf[start:stop]) * (cy - ay))
+        a = start + np.nanargmax(area) if np.any(np.isfinite(area)) else start
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+
+methods = {'minmax': minmax, 'lttb': lttb}
+
+
+class DownsampledLine(object):
+    """
+    A line that draws only the downsampled visible part of the series
+    and re-fetches the detail from the full arrays when the axes are zoomed.
+    """
+
+    def __init__(self, ax, x, y, method='minmax', points=None, **kwargs):
+        """
+        :param points: number of buckets (minmax) or points (lttb);
+        the width of the axes in pixels by default
+        :param kwargs: passed to Axes.plot
+        """
+        self.ax = ax
+        self.x = np.asarray(x)
+        self.y = np.asarray(y, dtype=float)
+        self.sorted = np.all(np.diff(self.x) >= 0) if len(self.x) > 1 else True
+        self.method = methods[method]
+        self.points = points
+        self.line, = ax.plot(*self._visible(None), **kwargs)
+        # the registry keeps bound methods by weak reference only
+        ax.callbacks.connect('xlim_changed', lambda a: self._on_xlim(a))
+
+    def _resolution(self):
+        if self.points: return self.points
+        width = int(self.ax.bbox.width)
+        return width if self.method is minmax else 2 * width
+
+    def _visible(self, xlim):
+        x, y = self.x, self.y
+        if xlim is not None:
+            if self.sorted:
+                i = max(np.searchsorted(x, xlim[0], side='left') - 1, 0)
+                j = np.searchsorted(x, xlim[1], side='right') + 1
+                x, y = x[i:j], y[i:j]
+            else:
+                mask = (x >= xlim[0]) & (x <= xlim[1])
+                x, y = x[mask], y[mask]
+        return self.method(x, y, self._resolution())
+
+    def _on_xlim(self, ax):
+        self.line.set_data(*self._visible(ax.get_xlim()))
+        ax.figure.canvas.draw_idle()
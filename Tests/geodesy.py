@@ -0,0 +1,84 @@
+"""
+Great-circle navigation on a sphere.
+All functions accept scalars or broadcastable arrays;
+latitudes, longitudes, bearings and angular distances are in radians,
+distances are scaled by the radius when it is given.
+"""
+from __future__ import print_function
+import numpy as np
+
+
+def dms(d=0, m=0, s=0):
+    """:return: angle in radians from degrees, minutes and seconds"""
+    return np.radians(np.asarray(d, dtype=float) + np.asarray(m) / 60.0 + np.asarray(s) / 3600.0)
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """:return: initial bearing of the great circle from point 1 to point 2"""
+    cos_lat2 = np.cos(lat2)
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * cos_lat2
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * cos_lat2 * np.cos(dlon)
+    return np.arctan2(y, x)
+
+
+def distance(lat1, lon1, lat2, lon2, radius=1.0):
+    """:return: great-circle distance between the points (haversine)"""
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(np.clip(h, 0, 1))) * radius
+
+
+def destination(lat, lon, brg, dist):
+    """:return: lat, lon of the point at the angular distance dist along the bearing"""
+    sin_dist = np.sin(dist)
+    cos_dist = np.cos(dist)
+    sin_lat1 = np.sin(lat)
+    cos_lat1 = np.cos(lat)
+    lat2 = np.arcsin(np.clip(sin_lat1 * cos_dist + cos_lat1 * sin_dist * np.cos(brg), -1, 1))
+    dlon2 = np.arctan2(np.sin(brg) * sin_dist * cos_lat1, cos_dist - sin_lat1 * np.sin(lat2))
+    return lat2, lon + dlon2
+
+
+def point_between(lat1, lon1, lat2, lon2, dist):
+    """:return: lat, lon of the point at the angular distance dist from point 1 towards point 2"""
+    return destination(lat1, lon1, bearing(lat1, lon1, lat2, lon2), dist)
+
+
+def path(lat1, lon1, lat2, lon2, num):
+    """:return: (num,) lat, lon arrays of the points evenly spaced along the great circle, ends included"""
+    d = distance(lat1, lon1, lat2, lon2)
+    return point_between(lat1, lon1, lat2, lon2, np.linspace(0, 1, num) * d)
+
+
+def cross_track(lat, lon, lat1, lon1, lat2, lon2, radius=1.0):
+    """
+    :return: signed distance of the point from the great circle through points 1 and 2;
+    positive to the right of the course
+    """
+    d13 = distance(lat1, lon1, lat, lon)
+    b13 = bearing(lat1, lon1, lat, lon)
+    b12 = bearing(lat1, lon1, lat2, lon2)
+    return np.arcsin(np.clip(np.sin(d13) * np.sin(b13 - b12), -1, 1)) * radius
+
+
+def along_track(lat, lon, lat1, lon1, lat2, lon2, radius=1.0):
+    """:return: distance from point 1 to the projection of the point onto the great circle through points 1 and 2"""
+    d13 = distance(lat1, lon1, lat, lon)
+    xt = cross_track(lat, lon, lat1, lon1, lat2, lon2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cos_at = np.clip(np.cos(d13) / np.cos(xt), -1, 1)
+    b13 = bearing(lat1, lon1, lat, lon)
+    b12 = bearing(lat1, lon1, lat2, lon2)
+    return np.sign(np.cos(b13 - b12)) * np.arccos(cos_at) * radius
+
+
+def waypoints(lats, lons, radius=1.0):
+    """
+    Legs of a waypoint path.
+    :param lats, lons: (N,) arrays of the waypoints
+    :return: (N-1,) arrays of the legs' initial bearings and lengths
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    return (bearing(lats[:-1], lons[:-1], lats[1:], lons[1:]),
+            distance(lats[:-1], lons[:-1], lats[1:], lons[1:], radius))
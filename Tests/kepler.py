@@ -0,0 +1,115 @@
+from __future__ import print_function
+import numpy as np
+
+from lambert import Emu
+
+
+def stumpff(z):
+    """:return: Stumpff functions C(z), S(z) for an array z"""
+    z = np.asarray(z, dtype=float)
+    C = np.empty_like(z)
+    S = np.empty_like(z)
+    small = np.abs(z) < 1e-3
+    pos = (z > 0) & ~small
+    neg = (z < 0) & ~small
+    zs = z[small]
+    C[small] = 1 / 2.0 - zs / 24.0 + zs * zs / 720.0 - zs ** 3 / 40320.0
+    S[small] = 1 / 6.0 - zs / 120.0 + zs * zs / 5040.0 - zs ** 3 / 362880.0
+    sz = np.sqrt(z[pos])
+    C[pos] = (1 - np.cos(sz)) / z[pos]
+    S[pos] = (sz - np.sin(sz)) / sz ** 3
+    sz = np.sqrt(-z[neg])
+    C[neg] = (np.cosh(sz) - 1) / -z[neg]
+    S[neg] = (np.sinh(sz) - sz) / sz ** 3
+    return C, S
+
+
+def propagate(r0, v0, t, mu=Emu, tol=1e-12, maxI=100):
+    """
+    Two-body propagation with the universal-variable Kepler solution.
+    Valid for elliptic, parabolic and hyperbolic orbits; elliptic
+    propagation times are reduced modulo the orbital period.
+    :param r0: (..., 3) initial positions
+    :param v0: (..., 3) initial velocities
+    :param t: (...) times since the initial state
+    :param mu: standard gravitational parameter
+    :return: (..., 3) positions and velocities at times t;
+    the shape is the broadcast shape of the inputs
+    """
+    r0 = np.asarray(r0, dtype=float)
+    v0 = np.asarray(v0, dtype=float)
+    t = np.asarray(t, dtype=float)
+    shape = np.broadcast(r0[..., 0], v0[..., 0], t).shape
+    r0 = np.broadcast_to(r0, shape + (3,))
+    v0 = np.broadcast_to(v0, shape + (3,))
+    t = np.broadcast_to(t, shape)
+    sqrt_mu = np.sqrt(mu)
+    R0 = np.sqrt(np.einsum('...i,...i->...', r0, r0))
+    vr0 = np.einsum('...i,...i->...', r0, v0) / R0
+    alpha = 2.0 / R0 - np.einsum('...i,...i->...', v0, v0) / mu
+    elliptic = alpha > 1e-12
+    hyperbolic = alpha < -1e-12
+    with np.errstate(invalid='ignore', divide='ignore'):
+        period = np.where(elliptic, 2 * np.pi / sqrt_mu / np.abs(alpha) ** 1.5, np.inf)
+        t = np.where(elliptic, np.fmod(t, period), t)
+        # initial guess (Vallado)
+        sign_t = np.where(t < 0, -1.0, 1.0)
+        sqrt_a = np.sqrt(-1 / alpha)
+        chi_h = sign_t * sqrt_a * np.log(-2 * mu * alpha * t /
+                                         (R0 * vr0 + sign_t * sqrt_mu * sqrt_a * (1 - R0 * alpha)))
+        chi = np.where(elliptic, sqrt_mu * alpha * t,
+                       np.where(hyperbolic & np.isfinite(chi_h), chi_h, sqrt_mu * t / R0))
+        # the Kepler equation is monotonic in chi; within a period chi is bounded
+        chi_period = np.where(elliptic, 2 * np.pi / np.sqrt(np.abs(alpha)), np.inf)
+    lo = np.where(t < 0, -chi_period, 0.0)
+    hi = np.where(t < 0, 0.0, chi_period)
+    k1 = R0 * vr0 / sqrt_mu
+    k2 = 1 - alpha * R0
+    for _i in range(maxI):
+        z = alpha * chi * chi
+        C, S = stumpff(z)
+        F = k1 * chi * chi * C + k2 * chi ** 3 * S + R0 * chi - sqrt_mu * t
+        dF = k1 * chi * (1 - z * S) + k2 * chi * chi * C + R0
+        lo = np.where(F < 0, chi, lo)
+        hi = np.where(F > 0, chi, hi)
+        new = chi - F / dF
+        # Newton step with bisection fallback when it leaves the bracket
+        bisect = ~((new > lo) & (new < hi)) & np.isfinite(lo) & np.isfinite(hi)
+        new = np.where(bisect, (lo + hi) / 2, new)
+        step = new - chi
+        chi = new
+        if np.all(np.abs(step) <= tol * np.maximum(np.abs(chi), 1)): break
+    z = alpha * chi * chi
+    C, S = stumpff(z)
+    f = 1 - chi * chi / R0 * C
+    g = t - chi ** 3 / sqrt_mu * S
+    r = f[..., None] * r0 + g[..., None] * v0
+    R = np.sqrt(np.einsum('...i,...i->...', r, r))
+    fdot = sqrt_mu / (R * R0) * (z * chi * S - chi)
+    gdot = 1 - chi * chi / R * C
+    v = fdot[..., None] * r0 + gdot[..., None] * v0
+    return r, v
+
+
+def integrate(r0, v0, t, mu=Emu, perturbation=None, rtol=1e-10, atol=1e-6, method='DOP853'):
+    """
+    Numerical two-body propagation with an optional perturbing acceleration,
+    using a high-order adaptive integrator.
+    :param r0: (3,) initial position
+    :param v0: (3,) initial velocity
+    :param t: (N,) increasing array of times at which to evaluate the state
+    :param perturbation: callable(t, r, v) -> (3,) additional acceleration
+    :return: (N, 3) positions and velocities
+    """
+    from scipy.integrate import solve_ivp
+
+    def rhs(_t, s):
+        r = s[:3]
+        a = -mu * r / np.linalg.norm(r) ** 3
+        if perturbation is not None: a = a + perturbation(_t, r, s[3:])
+        return np.concatenate([s[3:], a])
+
+    t = np.asarray(t, dtype=float)
+    s0 = np.concatenate([np.asarray(r0, dtype=float), np.asarray(v0, dtype=float)])
+    sol = solve_ivp(rhs, (0, t[-1]), s0, method=method, t_eval=t, rtol=rtol, atol=atol)
+    return sol.y[:3].T, sol.y[3:].T
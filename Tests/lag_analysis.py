@@ -0,0 +1,137 @@
+from __future__ import print_function
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from oscillation_analysis import frames, windows
+
+
+def _nfft(n):
+    """:return: the smallest power of two not less than n"""
+    return 1 << int(np.ceil(np.log2(max(n, 2))))
+
+
+def _peaks(lags, corr):
+    """
+    Lag and value of the extremum of |corr| along the last axis,
+    the lag refined by parabolic interpolation; extrema at the first
+    or the last lag are not refined.
+    :return: lags (in samples) and correlations at them
+    """
+    a = np.abs(corr)
+    n = corr.shape[-1]
+    i = np.argmax(a, axis=-1)
+    inner = (i > 0) & (i < n - 1)
+    take = lambda k: np.take_along_axis(a, np.clip(k, 0, n - 1)[..., None], -1)[..., 0]
+    l, c, r = take(i - 1), take(i), take(i + 1)
+    den = l - 2 * c + r
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = np.clip(np.where(inner & (den < 0), 0.5 * (l - r) / den, 0.0), -0.5, 0.5)
+    value = np.take_along_axis(corr, i[..., None], -1)[..., 0]
+    return lags[i] + p, value
+
+
+def xcorr(values, pairs, max_lag):
+    """
+    Normalized cross-correlations of the pairs of columns computed with FFT;
+    each column is transformed once for all the pairs it is in.
+    The correlation at lag k is sum(a[n] * b[n + k]) of the demeaned columns
+    divided by their norms, so that a positive lag means that b follows a.
+    :param values: (..., N, C) array of samples
+    :param pairs: list of (i, j) column indices
+    :param max_lag: the maximum lag in samples
+    :return: lags (samples) and (..., P, 2*max_lag+1) correlations
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.shape[-2]
+    max_lag = min(int(max_lag), n - 1)
+    x = values - values.mean(axis=-2, keepdims=True)
+    norm = np.sqrt((x * x).sum(axis=-2))
+    # padding to n + max_lag keeps the circular correlation exact within +-max_lag
+    spectra = np.fft.rfft(x, n=_nfft(n + max_lag), axis=-2)
+    i, j = np.array(pairs, dtype=int).reshape(-1, 2).T
+    cc = np.fft.irfft(spectra[..., i].conj() * spectra[..., j], axis=-2)
+    cc = np.concatenate([cc[..., -max_lag:, :], cc[..., :max_lag + 1, :]], axis=-2) if max_lag else cc[..., :1, :]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cc /= (norm[..., i] * norm[..., j])[..., None, :]
+    return np.arange(-max_lag, max_lag + 1), np.swapaxes(cc, -1, -2)
+
+
+def _pairs(columns, pairs):
+    columns = list(columns)
+    if pairs is None: pairs = list(combinations(columns, 2))
+    used = []
+    for c in (c for p in pairs for c in p):
+        if c not in used: used.append(c)
+    return pairs, used, [(used.index(a), used.index(b)) for a, b in pairs]
+
+
+def _time(df, time):
+    """:return: the time column as a float array"""
+    if time not in df:
+        raise ValueError('No time column %s; the lags and windows are in seconds' % time)
+    return np.asarray(df[time], dtype=float)
+
+
+def lag_table(df, columns=None, pairs=None, max_lag=5.0, time='UT'):
+    """
+    Lag and peak correlation of each pair of the columns over the whole log.
+    :param columns: columns to pair; all but the time if None
+    :param pairs: list of (a, b) column names; all pairs of the columns if None
+    :param max_lag: the maximum lag in seconds
+    :param time: the time column, s
+    :return: DataFrame with a row per pair: a, b, lag (s; positive if b follows a), corr
+    """
+    t = _time(df, time)
+    dt = np.median(np.diff(t))
+    if columns is None: columns = [c for c in df.columns if c != time]
+    pairs, used, idx = _pairs(columns, pairs)
+    lags, cc = xcorr(df[used].values, idx, int(round(max_lag / dt)))
+    lag, corr = _peaks(lags, cc)
+    return pd.DataFrame({'a': [a for a, _b in pairs], 'b': [b for _a, b in pairs],
+                         'lag': lag * dt, 'corr': corr},
+                        columns=['a', 'b', 'lag', 'corr'])
+
+
+def windowed_lag_table(df, columns=None, pairs=None, window=30.0, overlap=0.75, max_lag=5.0,
+                       time='UT', block=256):
+    """
+    Lag and peak correlation of each pair of the columns in overlapping windows.
+    The windows are transformed in blocks to keep the memory bounded on long logs.
+    :param window: window length in seconds
+    :param overlap: fraction of the window shared by consecutive windows
+    :param time: the time column, s
+    :param block: number of windows transformed at once
+    :return: DataFrame with a row per window and pair: a, b, start, end, lag, corr
+    """
+    t = _time(df, time)
+    dt, w, hop = windows(t, window, overlap)
+    if columns is None: columns = [c for c in df.columns if c != time]
+    pairs, used, idx = _pairs(columns, pairs)
+    f = frames(df[used].values, w, hop)
+    nframes = f.shape[1]
+    lag, corr = np.empty((nframes, len(pairs))), np.empty((nframes, len(pairs)))
+    for s in range(0, nframes, block):
+        chunk = np.transpose(f[:, s:s + block], (1, 2, 0))
+        lags, cc = xcorr(chunk, idx, int(round(max_lag / dt)))
+        lag[s:s + block], corr[s:s + block] = _peaks(lags, cc)
+    starts = np.arange(nframes) * hop
+    return pd.DataFrame({'a': np.tile([a for a, _b in pairs], nframes),
+                         'b': np.tile([b for _a, b in pairs], nframes),
+                         'start': np.repeat(t[starts], len(pairs)),
+                         'end': np.repeat(t[starts + w - 1], len(pairs)),
+                         'lag': lag.ravel() * dt,
+                         'corr': corr.ravel()},
+                        columns=['a', 'b', 'start', 'end', 'lag', 'corr'])
+
+
+def plot_lags(table, ax=None):
+    """Plots the windowed lags of every pair against the middle of the windows"""
+    import matplotlib.pyplot as plt
+    if ax is None: ax = plt.gca()
+    for (a, b), rows in table.groupby(['a', 'b'], sort=False):
+        ax.plot((rows.start + rows.end) / 2, rows.lag, label='%s -> %s' % (a, b))
+    ax.set_ylabel('lag, s')
+    ax.legend()
+    ax.grid(True)
@@ -0,0 +1,291 @@
+from __future__ import print_function
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+Emu = 3.9860044189e14
+
+# solution status codes
+CONVERGED = 0
+MIN_ENERGY = 1
+PARABOLIC = 2
+FAILED = 3
+NO_SOLUTION = 4
+
+# multi-revolution branches: x below or above the minimum transfer time point
+LEFT = 'left'
+RIGHT = 'right'
+
+
+class LambertSolution(object):
+    """
+    Solutions of a batch of Lambert problems.
+    All arrays have the broadcast shape of the inputs
+    (vectors have an additional trailing axis of 3).
+    """
+
+    def __init__(self, shape, V1, V2, transfer_time, x, status, order, iterations,
+                 revolutions=0, branch=None):
+        self.shape = shape
+        self.V1 = V1
+        self.V2 = V2
+        self.transfer_time = transfer_time
+        self.x = x
+        self.status = status
+        self.order = order
+        self.iterations = iterations
+        self.revolutions = revolutions
+        self.branch = branch
+
+    @property
+    def ok(self):
+        """:return: boolean array of the lanes that have a valid solution"""
+        return (self.status == CONVERGED) | (self.status == MIN_ENERGY)
+
+    def __str__(self):
+        return '\n'.join([
+            'revolutions: %d%s' % (self.revolutions, ', %s branch' % self.branch if self.branch else ''),
+            'lanes:       %d' % self.status.size,
+            'converged:   %d' % np.sum(self.status == CONVERGED),
+            'min energy:  %d' % np.sum(self.status == MIN_ENERGY),
+            'parabolic:   %d' % np.sum(self.status == PARABOLIC),
+            'no solution: %d' % np.sum(self.status == NO_SOLUTION),
+            'failed:      %d' % np.sum(self.status == FAILED),
+            'iterations:  max %d' % (self.iterations.max() if self.iterations.size else 0)])
+
+
+def _norm(v): return np.sqrt(np.einsum('...i,...i->...', v, v))
+
+
+class _Geometry(object):
+    """
+    Transfer geometry of the lanes, as in MiscCalculations.lambert_solver.
+    Does not depend on the transfer time, so it is cached and reused.
+    """
+
+    def __init__(self, r1, r2, mu, prograde):
+        self.mu = mu
+        self.r1 = r1
+        self.r2 = r2
+        self.R1 = _norm(r1)
+        self.R2 = _norm(r2)
+        cv = r2 - r1
+        self.c = _norm(cv)
+        self.chord = cv / self.c[:, None]
+        self.m = self.R1 + self.R2 + self.c
+        self.n = self.R1 + self.R2 - self.c
+        psi = np.arccos(np.clip(np.einsum('ij,ij->i', r1, r2) / (self.R1 * self.R2), -1, 1))
+        hz = np.cross(r1, r2)[:, 2]
+        psi = np.where(np.where(prograde, hz < 0, hz >= 0), 2 * np.pi - psi, psi)
+        self.sigma = np.sqrt(self.n / self.m) * np.where(psi < np.pi, 1.0, -1.0)
+        self.sigma3 = self.sigma ** 3
+        self.sigma5 = self.sigma ** 5
+        self.tauME = np.arccos(self.sigma) + self.sigma * np.sqrt(1 - self.sigma ** 2)
+        self._x_min = {}
+
+    def tau(self, t):
+        return 4 * t * np.sqrt(self.mu / self.m ** 3)
+
+    def invtau(self, tau):
+        return tau / 4 / np.sqrt(self.mu / self.m ** 3)
+
+    def y(self, x, i):
+        return np.copysign(np.sqrt(1 - self.sigma[i] ** 2 * (1 - x * x)), self.sigma[i])
+
+    def tau_x(self, x, i, revolutions=0):
+        """Normalized transfer time as a function of x"""
+        y = self.y(x, i)
+        one_x2 = np.sqrt(1 - x * x)
+        one_y2 = np.sqrt(1 - y * y)
+        return (((revolutions * np.pi + np.arccos(x) - x * one_x2) - (np.arctan(one_y2 / y) - y * one_y2))
+                / (one_x2 ** 3))
+
+    def dtau_x(self, x, i, tau_x):
+        return 1 / (1 - x * x) * (3 * x * tau_x - 2 * (1 - self.sigma3[i] * x / np.abs(self.y(x, i))))
+
+    def next_x(self, x, tau, order, i):
+        """Laguerre step of lambert_solver.next_x for the lanes i"""
+        y = self.y(x, i)
+        f = self.tau_x(x, i) - tau
+        f1 = self.dtau_x(x, i, f + tau)
+        f2 = 1 / (x * (1 - x * x)) * ((1 + 4 * x * x) * f1 + 2 * (1 - self.sigma5[i] * x ** 3 / np.abs(y) ** 3))
+        G = f1 / f
+        G2 = G * G
+        H = G2 - f2 / f
+        s = np.sqrt((order - 1) * (order * H - G2))
+        a = order / np.where(np.abs(G + s) > np.abs(G - s), G + s, G - s)
+        # halve the step until |x1| <= 1
+        over = np.isfinite(a) & (np.abs(x - a) > 1)
+        while np.any(over):
+            a = np.where(over, a / 2, a)
+            over = np.isfinite(a) & (np.abs(x - a) > 1)
+        return x - a
+
+    def x_min(self, revolutions, tol=1e-13):
+        """x of the minimum transfer time with the given number of revolutions, for all lanes"""
+        x = self._x_min.get(revolutions)
+        if x is None:
+            i = slice(None)
+            lo = np.full(self.sigma.shape, -1 + tol)
+            hi = np.full(self.sigma.shape, 1 - tol)
+            while np.any(hi - lo > tol):
+                mid = (lo + hi) / 2
+                rising = self.dtau_x(mid, i, self.tau_x(mid, i, revolutions)) > 0
+                hi = np.where(rising, mid, hi)
+                lo = np.where(rising, lo, mid)
+            x = self._x_min[revolutions] = (lo + hi) / 2
+        return x
+
+    def velocities(self, x, i=slice(None)):
+        sqrt_mu = np.sqrt(self.mu)
+        y = self.y(x, i)
+        vr = sqrt_mu * (y / np.sqrt(self.n[i]) - x / np.sqrt(self.m[i]))
+        vc = sqrt_mu * (y / np.sqrt(self.n[i]) + x / np.sqrt(self.m[i]))
+        chord = self.chord[i] * vc[:, None]
+        return (chord + self.r1[i] / self.R1[i][:, None] * vr[:, None],
+                chord - self.r2[i] / self.R2[i][:, None] * vr[:, None])
+
+
+_geometry_cache = OrderedDict()
+_geometry_cache_size = 16
+
+
+def _geometry(r1, r2, mu, prograde):
+    h = hashlib.sha1()
+    for a in (r1, r2, [mu], prograde):
+        h.update(np.ascontiguousarray(a, dtype=float).tobytes())
+    key = h.hexdigest()
+    geo = _geometry_cache.pop(key, None)
+    if geo is None:
+        geo = _Geometry(r1, r2, mu, prograde)
+    _geometry_cache[key] = geo
+    if len(_geometry_cache) > _geometry_cache_size:
+        _geometry_cache.popitem(last=False)
+    return geo
+
+
+def _solve_single(geo, tau, tol, maxI, max_order):
+    """Single-revolution solution with the Laguerre iterations of lambert_solver.solve"""
+    N = tau.size
+    x = np.zeros(N)
+    status = np.full(N, FAILED)
+    order = np.ones(N)
+    iterations = np.zeros(N, dtype=int)
+    me = np.abs(tau - geo.tauME) < 1e-6
+    parabolic = ~me & (tau <= 2.0 / 3 * (1 - geo.sigma3))
+    status[me] = MIN_ENERGY
+    status[parabolic] = PARABOLIC
+    lanes = np.flatnonzero(~me & ~parabolic)
+    x0 = np.where(tau < geo.tauME, 0.5, -0.5)
+    x[lanes] = x0[lanes]
+    stage = np.zeros(N, dtype=int)
+    while lanes.size:
+        x1 = geo.next_x(x[lanes], tau[lanes], order[lanes], lanes)
+        iterations[lanes] += 1
+        stage[lanes] += 1
+        converged = np.abs(x1 - x[lanes]) <= tol
+        x[lanes] = x1
+        status[lanes[converged]] = CONVERGED
+        restart = ~converged & (np.isnan(x1) | (stage[lanes] >= maxI))
+        if np.any(restart):
+            ri = lanes[restart]
+            order[ri] *= 2
+            stage[ri] = 0
+            x[ri] = x0[ri]
+            lanes = np.concatenate([lanes[~converged & ~restart], ri[order[ri] <= max_order]])
+        else: lanes = lanes[~converged]
+    x[status == FAILED] = np.nan
+    x[me] = 0
+    return x, status, order, iterations
+
+
+def _solve_multi(geo, tau, revolutions, branch, tol):
+    """
+    Multi-revolution solution: the transfer time is monotonic on either side
+    of its minimum, so each branch is solved by bisection.
+    """
+    N = tau.size
+    i = slice(None)
+    xm = geo.x_min(revolutions)
+    feasible = tau >= geo.tau_x(xm, i, revolutions)
+    left = branch == LEFT
+    lo = np.where(left, -1 + tol, xm)
+    hi = np.where(left, xm, 1 - tol)
+    iterations = np.zeros(N, dtype=int)
+    while np.any(hi - lo > tol):
+        mid = (lo + hi) / 2
+        above = geo.tau_x(mid, i, revolutions) > tau
+        # tau_x decreases on the left branch and increases on the right one
+        move_lo = above if left else ~above
+        lo = np.where(move_lo, mid, lo)
+        hi = np.where(move_lo, hi, mid)
+        iterations += 1
+    x = np.where(feasible, (lo + hi) / 2, np.nan)
+    status = np.where(feasible, CONVERGED, NO_SOLUTION)
+    return x, status, np.ones(N), iterations
+
+
+def solve_lambert(r1, r2, t, mu=Emu, revolutions=0, branch=LEFT, prograde=True,
+                  tol=1e-6, maxI=100, max_order=2 ** 10):
+    """
+    Solves Lambert problems for arrays of endpoints and transfer times
+    using the formulation of MiscCalculations.lambert_solver.
+    Single-revolution lanes are iterated simultaneously, each stopping when converged;
+    lanes producing NaN or not converging in maxI iterations are restarted
+    with a doubled Laguerre order, as lambert_solver.solve does.
+    Multi-revolution lanes are solved by bisection on the selected branch.
+    The time-independent geometry of the endpoints is cached.
+    :param r1: (..., 3) start positions
+    :param r2: (..., 3) end positions
+    :param t: (...) transfer times
+    :param mu: standard gravitational parameter
+    :param revolutions: number of full revolutions before the arrival
+    :param branch: LEFT or RIGHT multi-revolution branch
+    :param prograde: (...) bool; prograde (counterclockwise about Z) or retrograde transfer
+    :param tol: convergence tolerance of x (for multi-revolution lanes, a precision of 1e-13 is used)
+    :param maxI: maximum number of iterations per Laguerre order
+    :param max_order: maximum Laguerre order
+    :rtype: LambertSolution
+    """
+    r1 = np.asarray(r1, dtype=float)
+    r2 = np.asarray(r2, dtype=float)
+    t = np.asarray(t, dtype=float)
+    prograde = np.asarray(prograde, dtype=bool)
+    shape = np.broadcast(r1[..., 0], r2[..., 0], t, prograde).shape
+    r1 = np.broadcast_to(r1, shape + (3,)).reshape(-1, 3)
+    r2 = np.broadcast_to(r2, shape + (3,)).reshape(-1, 3)
+    t = np.broadcast_to(t, shape).reshape(-1)
+    prograde = np.broadcast_to(prograde, shape).reshape(-1)
+    N = t.size
+    geo = _geometry(r1, r2, mu, prograde)
+    tau = geo.tau(t)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if revolutions > 0:
+            assert branch in (LEFT, RIGHT), 'Unknown branch: %s' % branch
+            x, status, order, iterations = _solve_multi(geo, tau, revolutions, branch, min(tol, 1e-13))
+        else:
+            branch = None
+            x, status, order, iterations = _solve_single(geo, tau, tol, maxI, max_order)
+        V1 = np.zeros((N, 3))
+        V2 = np.zeros((N, 3))
+        ok = (status == CONVERGED) | (status == MIN_ENERGY)
+        V1[ok], V2[ok] = geo.velocities(x[ok], ok)
+    transfer_time = np.where(status == PARABOLIC, 0.0, t)
+    return LambertSolution(shape,
+                           V1.reshape(shape + (3,)), V2.reshape(shape + (3,)),
+                           transfer_time.reshape(shape), x.reshape(shape),
+                           status.reshape(shape), order.reshape(shape),
+                           iterations.reshape(shape), revolutions, branch)
+
+
+def solve_lambert_all(r1, r2, t, mu=Emu, max_revolutions=0, prograde=True, **kwargs):
+    """
+    Solves the batch for all the numbers of revolutions up to max_revolutions
+    and both multi-revolution branches.
+    :return: list of LambertSolution, single-revolution first
+    """
+    solutions = [solve_lambert(r1, r2, t, mu, 0, prograde=prograde, **kwargs)]
+    for revs in range(1, max_revolutions + 1):
+        for branch in (LEFT, RIGHT):
+            solutions.append(solve_lambert(r1, r2, t, mu, revs, branch, prograde, **kwargs))
+    return solutions
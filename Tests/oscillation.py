@@ -0,0 +1,288 @@
+from __future__ import print_function
+import numpy as np
+
+
+class OscillationDetector(object):
+    """
+    Sliding DFT over a window of the last samples.
+    Each sample is added with a single complex multiply-add per bin:
+    the phasors of the bins are rotated recursively by the twiddle factors
+    of the sampling interval and are periodically recomputed
+    from the exact time to bound the rounding drift.
+    The spectrum is the real (cosine) part of the sliding DFT.
+    """
+
+    def __init__(self, low, high, bins, window, renormalize=1024):
+        self.bins = bins
+        self.window = window
+        self.low = low * 2 * np.pi
+        self.high = high * 2 * np.pi
+        self.freqs = np.linspace(self.low, self.high, bins)
+        self.renormalize = renormalize
+        self.reset()
+
+    def reset(self):
+        self._dft = np.zeros(self.bins, dtype=complex)
+        self._vals = np.zeros(self.window)
+        self._times = np.zeros(self.window)
+        self._phasors = np.zeros((self.window, self.bins), dtype=complex)
+        self._pos = 0
+        self._count = 0
+        self._time = None
+        self._phasor = np.ones(self.bins, dtype=complex)
+        self._twiddle_dt = None
+        self._twiddle = None
+        self._since_renorm = 0
+
+    @property
+    def spectrum(self):
+        return self._dft.real
+
+    def _renormalize(self):
+        """recompute the phasor and the DFT from the exact times of the samples"""
+        self._phasor = np.exp(1j * self.freqs * self._time)
+        n = min(self._count, self.window)
+        self._phasors[:n] = np.exp(1j * np.outer(self._times[:n], self.freqs))
+        self._dft = self._vals[:n].dot(self._phasors[:n])
+        self._since_renorm = 0
+
+    def update(self, val, dt):
+        val /= self.window
+        if self._time is None:
+            self._time = 0.0
+        else:
+            self._time += dt
+            if dt != self._twiddle_dt:
+                self._twiddle_dt = dt
+                self._twiddle = np.exp(1j * self.freqs * dt)
+            self._phasor *= self._twiddle
+        pos = self._pos
+        if self._count >= self.window:
+            self._dft += val * self._phasor - self._vals[pos] * self._phasors[pos]
+        else: self._dft += val * self._phasor
+        self._vals[pos] = val
+        self._times[pos] = self._time
+        self._phasors[pos] = self._phasor
+        self._pos = (pos + 1) % self.window
+        self._count += 1
+        self._since_renorm += 1
+        if self._since_renorm >= self.renormalize: self._renormalize()
+
+    def process(self, signal, dt, history=False, chunk=8192):
+        """
+        Feeds the whole signal to the detector at once.
+        :param signal: (N,) array of samples
+        :param dt: sampling interval, scalar or (N,) array
+        :param history: if True, return the (N, bins) spectrum after each sample
+        :param chunk: number of samples processed at once when computing the history
+        :return: the final spectrum or the spectrum history
+        """
+        vals = np.asarray(signal, dtype=float) / self.window
+        N = len(vals)
+        if not N: return np.zeros((0, self.bins)) if history else self.spectrum
+        dts = np.broadcast_to(np.asarray(dt, dtype=float), (N,))
+        # times accumulated exactly as by the sequential update
+        if self._time is None:
+            times = np.add.accumulate(np.concatenate([[0.0], dts[1:]]))
+        else:
+            times = np.add.accumulate(np.concatenate([[self._time], dts]))[1:]
+        # samples currently in the window, oldest first
+        n = min(self._count, self.window)
+        order = (np.arange(n) + (self._pos - n)) % self.window
+        all_vals = np.concatenate([self._vals[order], vals])
+        all_times = np.concatenate([self._times[order], times])
+        spectra = np.empty((N, self.bins)) if history else None
+        if history:
+            # spectrum at step k is the sum of the contributions of the last window samples
+            dft = self._vals[order].dot(self._phasors[order])
+            for start in range(0, N, chunk):
+                stop = min(start + chunk, N)
+                i = np.arange(n + start, n + stop)
+                c = all_vals[i, None] * np.exp(1j * np.outer(all_times[i], self.freqs))
+                old = i - self.window
+                c[old >= 0] -= (all_vals[old[old >= 0], None] *
+                                np.exp(1j * np.outer(all_times[old[old >= 0]], self.freqs)))
+                cs = dft + np.cumsum(c, axis=0)
+                spectra[start:stop] = cs.real
+                dft = cs[-1]
+        # new state: the last window samples
+        last = slice(max(len(all_vals) - self.window, 0), None)
+        w_vals = all_vals[last]
+        w_times = all_times[last]
+        w = len(w_vals)
+        self._count += N
+        self._pos = self._count % self.window if self._count >= self.window else w
+        idx = (np.arange(w) + (self._pos - w)) % self.window
+        self._vals[idx] = w_vals
+        self._times[idx] = w_times
+        self._time = times[-1]
+        self._renormalize()
+        return spectra if history else self.spectrum
+
+
+class Signal(object):
+    """
+    Test signal for the detector parameter search.
+    The signal is resampled to the sampling interval of every configuration.
+    """
+
+    def __init__(self, name, t, values, freq=None, onset=0.0):
+        """
+        :param t: (N,) increasing sample times
+        :param values: (N,) samples
+        :param freq: frequency (Hz) of the oscillation the detector should find;
+        None for signals without oscillations
+        :param onset: time at which the oscillation starts
+        """
+        self.name = name
+        self.t = np.asarray(t, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        self.freq = freq
+        self.onset = onset
+
+    @classmethod
+    def from_frame(cls, df, column, time='UT', freq=None, onset=0.0):
+        """Recorded signal from a column of a telemetry DataFrame"""
+        t = np.asarray(df[time], dtype=float)
+        return cls(column, t - t[0], df[column], freq, onset)
+
+    def sample(self, dt):
+        """:return: times since the start and the signal resampled with dt"""
+        t = np.arange(self.t[0], self.t[-1], dt)
+        return t - self.t[0], np.interp(t, self.t, self.values)
+
+
+def synthetic_signals(duration=10.0, freqs=(1, 2, 5, 10, 20), onset=2.0, noise=0.05, seed=None):
+    """
+    Library of synthetic test signals: constant, noisy and stepped DC
+    without oscillations, and unit sines starting at the onset,
+    alone and over a DC offset.
+    """
+    rnd = np.random.RandomState(seed)
+    t = np.arange(0, duration, 1e-3)
+    on = t >= onset
+    signals = [Signal('DC', t, np.ones_like(t)),
+               Signal('DC+noise', t, 1 + rnd.normal(0, noise, t.shape)),
+               Signal('step', t, on.astype(float))]
+    for f in freqs:
+        sine = np.sin((t - onset) * f * 2 * np.pi) * on
+        signals.append(Signal('%gHz' % f, t, sine, f, onset))
+        signals.append(Signal('%gHz+DC' % f, t, 1 + sine + rnd.normal(0, noise, t.shape), f, onset))
+    return signals
+
+
+def score_detector(config, signals, threshold=0.1):
+    """
+    Runs a detector configuration over the test signals.
+    An oscillation is detected when the peak of the absolute spectrum
+    reaches the threshold at the bin nearest to its frequency.
+    :param config: (low, high, bins, window, dt)
+    :return: latency: mean detection latency of the oscillating signals, s;
+    missed: number of the oscillating signals never detected;
+    false_positives: fraction of the signals without oscillations that triggered the detector;
+    false_peak: maximum spectrum peak on the signals without oscillations;
+    resolution: bin width, Hz;
+    freq_error: mean error of the detected frequency at the end of the oscillating signals, Hz
+    """
+    low, high, bins, window, dt = config
+    latencies, errors = [], []
+    missed, positives, negatives, false_peak = 0, 0, 0, 0.0
+    for s in signals:
+        t, values = s.sample(dt)
+        od = OscillationDetector(low, high, bins, window)
+        spectra = np.abs(od.process(values, dt, history=True))
+        peak = spectra.max(axis=1)
+        detected = peak >= threshold
+        if s.freq is None:
+            negatives += 1
+            positives += np.any(detected)
+            false_peak = max(false_peak, peak.max())
+            continue
+        freqs = od.freqs / 2 / np.pi
+        target = np.argmin(np.abs(freqs - s.freq))
+        hit = detected & (spectra.argmax(axis=1) == target) & (t >= s.onset)
+        if np.any(hit): latencies.append(t[np.argmax(hit)] - s.onset)
+        else: missed += 1
+        errors.append(abs(freqs[spectra[-1].argmax()] - s.freq))
+    return (np.mean(latencies) if latencies else np.inf,
+            missed,
+            float(positives) / negatives if negatives else 0.0,
+            false_peak,
+            (high - low) / (bins - 1.0) if bins > 1 else np.inf,
+            np.mean(errors) if errors else np.nan)
+
+
+_signals = None
+_threshold = None
+
+
+def _init_worker(signals, threshold):
+    global _signals, _threshold
+    _signals = signals
+    _threshold = threshold
+
+
+def _score_job(config):
+    return score_detector(config, _signals, _threshold)
+
+
+class SearchResult(object):
+    """Scores of the detector configurations"""
+
+    fields = ('latency', 'missed', 'false_positives', 'false_peak', 'resolution', 'freq_error')
+
+    def __init__(self, configs, scores):
+        self.configs = configs
+        scores = np.array(scores, dtype=float).reshape(-1, len(self.fields))
+        for i, f in enumerate(self.fields):
+            setattr(self, f, scores[:, i])
+
+    def rank(self, latency=1.0, false_peak=1.0, resolution=1.0):
+        """
+        Orders the configurations: the fewest missed oscillations and false
+        positives first, then by the weighted sum of latency, false peak and
+        resolution, each normalized by its median over the configurations.
+        :return: indices of the configurations, best first
+        """
+        cost = np.zeros(len(self.configs))
+        for w, v in ((latency, self.latency), (false_peak, self.false_peak), (resolution, self.resolution)):
+            finite = np.isfinite(v)
+            median = np.median(v[finite]) if np.any(finite) else 1.0
+            cost += w * np.where(finite, v / (median or 1.0), np.inf)
+        return np.lexsort((cost, self.false_positives, self.missed))
+
+    def best(self, num=10, **kwargs):
+        """:return: list of (config, scores dict) of the best configurations"""
+        return [(self.configs[i], dict((f, getattr(self, f)[i]) for f in self.fields))
+                for i in self.rank(**kwargs)[:num]]
+
+    def __str__(self, num=20):
+        lines = ['%6s %6s %5s %6s %6s | %8s %6s %6s %8s %8s %8s' %
+                 (('low', 'high', 'bins', 'window', 'dt') + self.fields)]
+        for i in self.rank()[:num]:
+            lines.append('%6g %6g %5d %6d %6g | %8.3f %6d %6.2f %8.4f %8.3f %8.3f' %
+                         (tuple(self.configs[i]) + tuple(getattr(self, f)[i] for f in self.fields)))
+        return '\n'.join(lines)
+
+
+def search_params(lows, highs, bins, windows, dts, signals=None, threshold=0.1, processes=1):
+    """
+    Evaluates every combination of the detector parameters over the test signals.
+    :param lows, highs: lower and upper frequencies of the band, Hz
+    :param bins: numbers of frequency bins
+    :param windows: window sizes, samples
+    :param dts: sampling intervals, s
+    :param signals: list of Signal; synthetic_signals() by default
+    :param processes: number of worker processes
+    :rtype: SearchResult
+    """
+    from itertools import product
+    if signals is None: signals = synthetic_signals()
+    configs = [c for c in product(lows, highs, bins, windows, dts) if c[0] < c[1]]
+    if processes > 1 and len(configs) > 1:
+        from multiprocessing import Pool
+        pool = Pool(processes, _init_worker, (signals, threshold))
+        try: scores = pool.map(_score_job, configs, chunksize=max(len(configs) // (processes * 4), 1))
+        finally: pool.close()
+    else: scores = [score_detector(c, signals, threshold) for c in configs]
+    return SearchResult(configs, scores)
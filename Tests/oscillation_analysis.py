@@ -8,7 +8,10 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
-from scipy.fftpack import fft
+from numpy.lib.stride_tricks import as_strided
+
+from telemetry_schema import load
+from binary_log import binary_copy
     
 def plt_show_maxed():
     plt.tight_layout(pad=0, h_pad=0, w_pad=0)
@@ -17,22 +20,118 @@ def plt_show_maxed():
     mng.window.showMaximized()
     plt.show()
 
+def frames(values, window, hop):
+    """
+    Overlapping windows of the columns without copying the data.
+    :param values: (N, C) array
+    :return: (C, F, window) strided view
+    """
+    values = np.ascontiguousarray(values, dtype=float)
+    N, C = values.shape
+    nframes = max((N - window) // hop + 1, 0)
+    s0, s1 = values.strides
+    return as_strided(values, shape=(C, nframes, window), strides=(s1, s0 * hop, s0), writeable=False)
+
+def stft(values, dt, window, hop):
+    """
+    Short-time Fourier transform of all the columns at once.
+    Each window is detrended and multiplied by the Hann window.
+    :param values: (N, C) array of samples
+    :param window: window length in samples
+    :param hop: distance between the starts of the windows in samples
+    :return: frequencies (Hz), start indices of the windows
+    and (C, F, bins) amplitude spectra
+    """
+    f = frames(values, window, hop)
+    hann = np.hanning(window)
+    spectra = np.fft.rfft((f - f.mean(axis=-1)[..., None]) * hann, axis=-1)
+    amplitudes = np.abs(spectra) * 2 / hann.sum()
+    return np.fft.rfftfreq(window, dt), np.arange(f.shape[1]) * hop, amplitudes
+
+def dominant(freqs, amplitudes):
+    """
+    Dominant frequency and amplitude of every spectrum,
+    refined by parabolic interpolation of the peak;
+    peaks in the first or the last bin are not refined.
+    :return: (C, F) frequencies and amplitudes
+    """
+    a = amplitudes[..., 1:]
+    n = a.shape[-1]
+    i = np.argmax(a, axis=-1)
+    inner = (i > 0) & (i < n - 1)
+    take = lambda k: np.take_along_axis(a, np.clip(k, 0, n - 1)[..., None], -1)[..., 0]
+    l, c, r = take(i - 1), take(i), take(i + 1)
+    den = l - 2 * c + r
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = np.where(inner & (den < 0), 0.5 * (l - r) / den, 0.0)
+    p = np.clip(p, -0.5, 0.5)
+    df = freqs[1] - freqs[0]
+    return (i + 1 + p) * df, c - 0.25 * (l - r) * p
+
+def windows(t, window, overlap):
+    """:return: sampling interval, window and hop lengths in samples"""
+    dt = np.median(np.diff(t))
+    w = int(round(window / dt))
+    return dt, w, max(int(round(w * (1 - overlap))), 1)
+
+def oscillation_table(df, columns, window=30.0, overlap=0.75, time='UT'):
+    """
+    Dominant frequency and amplitude of the columns in overlapping windows.
+    :param window: window length in seconds
+    :param overlap: fraction of the window shared by consecutive windows
+    :return: DataFrame with a row per window and column
+    """
+    t = np.asarray(df[time], dtype=float)
+    dt, w, hop = windows(t, window, overlap)
+    freqs, starts, amplitudes = stft(df[list(columns)].values, dt, w, hop)
+    freq, amp = dominant(freqs, amplitudes)
+    nframes = len(starts)
+    return pd.DataFrame({'column': np.repeat(list(columns), nframes),
+                         'start': np.tile(t[starts], len(columns)),
+                         'end': np.tile(t[starts + w - 1], len(columns)),
+                         'freq': freq.ravel(),
+                         'amplitude': amp.ravel()},
+                        columns=['column', 'start', 'end', 'freq', 'amplitude'])
+
+def sustained(table, min_amplitude, min_duration=10.0, freq_tol=0.1):
+    """
+    Flags sustained oscillations: runs of consecutive windows of a column
+    with amplitude above min_amplitude and the dominant frequency within
+    the relative freq_tol of the previous window.
+    Adds the boolean 'sustained' column to the table.
+    :return: DataFrame of the oscillations: column, start, end, mean freq and amplitude
+    """
+    events = []
+    table['sustained'] = False
+    for column, rows in table.groupby('column', sort=False):
+        freq = rows.freq.values
+        strong = rows.amplitude.values >= min_amplitude
+        same = np.ones(len(rows), dtype=bool)
+        same[1:] = np.abs(freq[1:] - freq[:-1]) <= freq_tol * freq[:-1]
+        # a run starts at every strong window that does not continue the previous one
+        start = strong & ~(np.roll(strong, 1) & same)
+        start[0] = strong[0]
+        run = np.cumsum(start)
+        run[~strong] = 0
+        for r in np.unique(run[run > 0]):
+            idx = np.nonzero(run == r)[0]
+            t0, t1 = rows.start.values[idx[0]], rows.end.values[idx[-1]]
+            if t1 - t0 < min_duration: continue
+            table.loc[rows.index[idx], 'sustained'] = True
+            events.append((column, t0, t1, freq[idx].mean(), rows.amplitude.values[idx].mean()))
+    return pd.DataFrame(events, columns=['column', 'start', 'end', 'freq', 'amplitude'])
+
+def plot_spectrogram(df, column, window=30.0, overlap=0.75, time='UT'):
+    t = np.asarray(df[time], dtype=float)
+    dt, w, hop = windows(t, window, overlap)
+    freqs, starts, amplitudes = stft(df[[column]].values, dt, w, hop)
+    plt.pcolormesh(t[starts] + window / 2, freqs, amplitudes[0].T, shading='auto')
+    plt.ylabel('%s, Hz' % column)
+    plt.colorbar()
+
 if __name__ == '__main__':
     data = 'oscillation.csv'
-    df = pd.read_csv(data, names=('tag', 
-                                  'UT',
-                                #HSC
-#                                 'Nx', 'Ny', 'Nz',
-#                                 'fTx', 'fTy', 'fTz',
-#                                 'Tx', 'Ty', 'Tz',
-#                                 ))
-                                #attitude
-                                'ErrDeg',
-                                'Sx', 'Sy', 'Sz',
-                                'AVx', 'AVy', 'AVz',
-                                'dSx', 'dSy', 'dSz',
-                                'Px', 'Py', 'Pz',
-                                ))
+    df = load(binary_copy(data, 'oscillation'))
     df.UT -= df.UT[0]
     del df['tag']
     #dt
@@ -49,7 +148,6 @@ if __name__ == '__main__':
         plt.ylabel(c)
         plt.grid()
     plt_show_maxed()
-    #fft
     
 #     x = np.arange(0,1, 0.001)
 #     y = x**0.40
@@ -57,24 +155,11 @@ if __name__ == '__main__':
 #     plt.grid()
 #     plt.xticks(np.arange(0,1,0.04), np.arange(0,1,0.04)*180)
 #     plt.show()
-    
-#     def ffreq(s):
-#         rlen = int(len(s)/2)
-#         fftres = fft(s)
-#         freqs = np.abs(fftres[:rlen])
-# #         plt.plot(np.array(range(rlen))*rate/rlen/2, freqs)
-# #         plt.show()
-#         ffbin = np.argmax(freqs)
-#         print 'Fundamental Frequency: %.2fHz, amplitude is %d' % (ffbin*rate/rlen/2, np.amax(freqs))
-#     
-#     window = 30
-#     w = int(window/dt)
-#     for c in df.columns[1:]:
-#         print
-#         print '-'*80
-#         print '%s: window: %d = %.2fs' % (c, w, window) 
-#         lasti = 0
-#         for i in xrange(w, w*(len(df[c])/w+2), w):
-#             print '[%.2fs, %.2fs)' % (lasti*dt, i*dt) 
-#             ffreq(df[c][lasti:i])
-#             lasti = i
\ No newline at end of file
+
+    #short-time spectra
+    table = oscillation_table(df, df.columns[1:], window=30)
+    print(sustained(table, min_amplitude=0.1))
+    for i, c in enumerate(cols):
+        plt.subplot(nplots,1,1+i)
+        plot_spectrogram(df, c, window=30)
+    plt_show_maxed()
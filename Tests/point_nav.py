@@ -0,0 +1,104 @@
+from __future__ import print_function
+import numpy as np
+
+from common import dt
+
+
+class ApproachResult(object):
+    """
+    Results of the point-navigation approach for every lane of a grid.
+    All arrays have the broadcast shape of the simulation parameters.
+    """
+
+    def __init__(self, shape, arrival, overshoot, speed, max_speed, trace=None):
+        self.shape = shape
+        self.arrival = arrival.reshape(shape)
+        self.overshoot = overshoot.reshape(shape)
+        self.speed = speed.reshape(shape)
+        self.max_speed = max_speed.reshape(shape)
+        self.trace = trace
+
+    @property
+    def arrived(self):
+        return np.isfinite(self.arrival)
+
+    def __str__(self):
+        arrived = self.arrived
+        lines = ['lanes:     %d, arrived %d' % (arrived.size, arrived.sum())]
+        if arrived.any():
+            lines += ['time:      min %.1f, mean %.1f, max %.1f s' %
+                      (self.arrival[arrived].min(), self.arrival[arrived].mean(), self.arrival[arrived].max()),
+                      'overshoot: mean %f, max %f m' % (self.overshoot[arrived].mean(), self.overshoot[arrived].max()),
+                      'speed:     mean %f, max %f m/s' % (self.speed[arrived].mean(), self.speed[arrived].max())]
+        return '\n'.join(lines)
+
+
+def simulate_approach(accel, distance, P=2.0, D=0.1, I=0.0, AAk=0.5, distanceF=0.1, max_action=10.0,
+                      adaptive=True, max_time=600.0, trace=False):
+    """
+    Point-navigation approach of sim_PointNav simulated for a whole grid of lanes at once.
+    The PID sets the desired speed from the remaining distance; the real
+    acceleration changes towards +-accel at the rate accel*AAk.
+    A lane terminates when the remaining distance becomes <= 0.
+    :param accel, distance, P, D, I, AAk, distanceF: broadcastable arrays of the lane parameters
+    :param adaptive: if True the proportional gain is P*accel/max(V, 0.01)
+    :param max_time: lanes still approaching by this time are reported with the arrival time inf
+    :param trace: if True, ApproachResult.trace is a dict of (steps, lanes) arrays
+    of t, d, v, act, A; NaN after the termination of a lane
+    :return: ApproachResult with the arrival time, the overshoot (distance past the point),
+    the speed at the arrival and the maximum speed
+    """
+    params = np.broadcast_arrays(*[np.asarray(p, dtype=float) for p in
+                                   (accel, distance, P, D, I, AAk, distanceF)])
+    shape = params[0].shape
+    a, d, P, D, I, AAk, dF = [p.ravel().copy() for p in params]
+    n = a.size
+    arrival = np.full(n, np.inf)
+    overshoot = np.full(n, np.nan)
+    speed = np.full(n, np.nan)
+    max_speed = np.zeros(n)
+    live = np.arange(n)
+    v = np.zeros(n)
+    A = np.zeros(n)
+    ierror = np.zeros(n)
+    perror = np.zeros(n)
+    records = [] if trace else None
+    if trace: records.append((live, d.copy(), v.copy(), np.zeros(n), A.copy()))
+    t = 0.0
+    while live.size and t < max_time:
+        # PID
+        err = d * dF
+        perror = np.where(perror == 0, err, perror)
+        kp = P * a / np.maximum(v, 0.01) if adaptive else P
+        ierror = np.where(ierror * err < 0, 0, ierror)
+        new_ierror = ierror + err * dt
+        act = kp * err + I * new_ierror + D * (err - perror) / dt
+        clamped = np.clip(act, 0, max_action)
+        ierror = np.where(clamped != act, ierror, new_ierror)
+        perror = err
+        # acceleration
+        da = a * AAk * dt
+        A = np.select([v < clamped, v > clamped, A > 0, A < 0],
+                      [np.where(A < a, A + da, a), np.where(A > -a, A - da, -a), A - da, A + da], 0.0)
+        v = v + A * dt
+        d = d - v * dt
+        t += dt
+        max_speed[live] = np.maximum(max_speed[live], v)
+        if trace: records.append((live, d.copy(), v.copy(), clamped.copy(), A.copy()))
+        done = d <= 0
+        if done.any():
+            idx = live[done]
+            arrival[idx] = t
+            overshoot[idx] = -d[done]
+            speed[idx] = v[done]
+            keep = ~done
+            live = live[keep]
+            a, d, P, D, I, AAk, dF = a[keep], d[keep], P[keep], D[keep], I[keep], AAk[keep], dF[keep]
+            v, A, ierror, perror = v[keep], A[keep], ierror[keep], perror[keep]
+    if trace:
+        trace = dict((k, np.full((len(records), n), np.nan)) for k in ('d', 'v', 'act', 'A'))
+        trace['t'] = np.arange(len(records)) * dt
+        for step, (lanes, rd, rv, ract, rA) in enumerate(records):
+            for k, r in zip(('d', 'v', 'act', 'A'), (rd, rv, ract, rA)):
+                trace[k][step, lanes] = r
+    return ApproachResult(shape, arrival, overshoot, speed, max_speed, trace)
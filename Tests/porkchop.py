@@ -0,0 +1,211 @@
+from __future__ import print_function
+import os
+import hashlib
+import numpy as np
+import matplotlib.pyplot as plt
+
+from lambert import solve_lambert_all, Emu
+from kepler import propagate
+
+
+class Orbit(object):
+    """Keplerian orbit defined by the state vector at time zero"""
+
+    def __init__(self, r, v, mu=Emu):
+        self.r = np.asarray(getattr(r, 'v', r), dtype=float)
+        self.v = np.asarray(getattr(v, 'v', v), dtype=float)
+        self.mu = float(mu)
+
+    def states(self, t):
+        """:return: (..., 3) positions and velocities at times t"""
+        return propagate(self.r, self.v, t, self.mu)
+
+    def key(self):
+        return np.concatenate([self.r, self.v, [self.mu]])
+
+
+def transfer_dV(chaser, target, departures, transfers, max_revolutions=0):
+    """
+    Rendezvous dV of the Lambert transfers from the chaser to the target orbit.
+    With max_revolutions > 0 the cheapest of the single- and multi-revolution
+    transfers is chosen for every grid point.
+    :type chaser: Orbit
+    :type target: Orbit
+    :param departures: (D,) departure times
+    :param transfers: (T,) transfer times
+    :return: (D, T) arrays of departure dV, arrival dV
+    and the number of revolutions of the transfer (-1 if there is none)
+    """
+    departures = np.asarray(departures, dtype=float)
+    transfers = np.asarray(transfers, dtype=float)
+    rc, vc = chaser.states(departures)
+    rt, vt = target.states(departures[:, None] + transfers[None, :])
+    shape = (len(departures), len(transfers))
+    dV1 = np.full(shape, np.nan)
+    dV2 = np.full(shape, np.nan)
+    revolutions = np.full(shape, -1)
+    for sol in solve_lambert_all(rc[:, None, :], rt, transfers[None, :], chaser.mu, max_revolutions):
+        sdV1 = np.linalg.norm(sol.V1 - vc[:, None, :], axis=-1)
+        sdV2 = np.linalg.norm(vt - sol.V2, axis=-1)
+        better = sol.ok & ~(sdV1 + sdV2 >= dV1 + dV2)
+        dV1[better] = sdV1[better]
+        dV2[better] = sdV2[better]
+        revolutions[better] = sol.revolutions
+    return dV1, dV2, revolutions
+
+
+def _tile_key(chaser, target, departures, transfers, max_revolutions):
+    h = hashlib.sha1()
+    for a in (chaser.key(), target.key(), departures, transfers, [max_revolutions]):
+        h.update(np.ascontiguousarray(a, dtype=float).tobytes())
+    return h.hexdigest()
+
+
+def _tile_job(args):
+    chaser, target, departures, transfers, max_revolutions, cache_dir = args
+    filename = None
+    if cache_dir:
+        key = _tile_key(chaser, target, departures, transfers, max_revolutions)
+        filename = os.path.join(cache_dir, key + '.npz')
+        if os.path.isfile(filename):
+            with np.load(filename) as tile:
+                return tile['dV1'], tile['dV2'], tile['revolutions']
+    dV1, dV2, revolutions = transfer_dV(chaser, target, departures, transfers, max_revolutions)
+    if filename:
+        tmp = filename + '.%d.tmp.npz' % os.getpid()
+        try:
+            np.savez(tmp, dV1=dV1, dV2=dV2, revolutions=revolutions)
+            os.rename(tmp, filename)
+        finally:
+            if os.path.exists(tmp): os.remove(tmp)
+    return dV1, dV2, revolutions
+
+
+class Porkchop(object):
+    """
+    Rendezvous dV over a grid of departure times x transfer times.
+    The grid is computed in tiles, which may be computed in parallel
+    and are cached on disk keyed by the orbits and the tile times.
+    """
+
+    def __init__(self, chaser, target, cache_dir=None, tile=64, processes=1, max_revolutions=0):
+        """
+        :type chaser: Orbit
+        :type target: Orbit
+        :param max_revolutions: maximum number of revolutions of the transfers
+        :param cache_dir: directory for the cached tiles; None disables caching
+        :param tile: maximum number of departure and transfer times in a tile
+        :param processes: number of worker processes
+        """
+        self.chaser = chaser
+        self.target = target
+        self.cache_dir = cache_dir
+        self.tile = tile
+        self.processes = processes
+        self.max_revolutions = max_revolutions
+        self.departures = None
+        self.transfers = None
+        self.dV1 = None
+        self.dV2 = None
+        self.revolutions = None
+        self.minima = []
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    @property
+    def dV(self): return self.dV1 + self.dV2
+
+    def _map(self, jobs):
+        if self.processes > 1 and len(jobs) > 1:
+            from multiprocessing import Pool
+            pool = Pool(self.processes)
+            try: return pool.map(_tile_job, jobs)
+            finally: pool.close()
+        return [_tile_job(j) for j in jobs]
+
+    def grid(self, departures, transfers):
+        """:return: dV1, dV2, revolutions (D, T) arrays assembled from tiles"""
+        departures = np.asarray(departures, dtype=float)
+        transfers = np.asarray(transfers, dtype=float)
+        dslices = [slice(i, i + self.tile) for i in range(0, len(departures), self.tile)]
+        tslices = [slice(j, j + self.tile) for j in range(0, len(transfers), self.tile)]
+        jobs = [(self.chaser, self.target, departures[ds], transfers[ts], self.max_revolutions, self.cache_dir)
+                for ds in dslices for ts in tslices]
+        dV1 = np.empty((len(departures), len(transfers)))
+        dV2 = np.empty_like(dV1)
+        revolutions = np.empty(dV1.shape, dtype=int)
+        tiles = iter(self._map(jobs))
+        for ds in dslices:
+            for ts in tslices:
+                dV1[ds, ts], dV2[ds, ts], revolutions[ds, ts] = next(tiles)
+        return dV1, dV2, revolutions
+
+    def compute(self, departures, transfers, refine=9, levels=3, max_minima=5):
+        """
+        Computes the porkchop grid and then adaptively refines
+        the neighbourhoods of its best local minima.
+        :param refine: number of points per axis of a refinement grid
+        :param levels: number of refinement levels
+        :param max_minima: number of the best local minima to refine
+        :return: list of (departure, transfer, dV) of the refined minima, best first
+        """
+        from scipy.ndimage import minimum_filter
+        self.departures = np.asarray(departures, dtype=float)
+        self.transfers = np.asarray(transfers, dtype=float)
+        self.dV1, self.dV2, self.revolutions = self.grid(self.departures, self.transfers)
+        dV = np.where(np.isfinite(self.dV), self.dV, np.inf)
+        local = (dV == minimum_filter(dV, size=3, mode='nearest')) & np.isfinite(dV)
+        candidates = sorted(zip(*np.nonzero(local)), key=lambda ij: dV[ij])[:max_minima]
+        self.minima = sorted((self._refine(i, j, refine, levels) for i, j in candidates),
+                             key=lambda m: m[2])
+        return self.minima
+
+    def _refine(self, i, j, refine, levels):
+        dep = self.departures
+        tt = self.transfers
+        best = (dep[i], tt[j], self.dV[i, j])
+        d0, d1 = dep[max(i - 1, 0)], dep[min(i + 1, len(dep) - 1)]
+        t0, t1 = tt[max(j - 1, 0)], tt[min(j + 1, len(tt) - 1)]
+        for _l in range(levels):
+            rdep = np.linspace(d0, d1, refine)
+            rtt = np.linspace(t0, t1, refine)
+            dV1, dV2, _revolutions = self.grid(rdep, rtt)
+            dV = dV1 + dV2
+            if not np.any(np.isfinite(dV)): break
+            ri, rj = np.unravel_index(np.nanargmin(dV), dV.shape)
+            if dV[ri, rj] < best[2]: best = (rdep[ri], rtt[rj], dV[ri, rj])
+            d0, d1 = rdep[max(ri - 1, 0)], rdep[min(ri + 1, refine - 1)]
+            t0, t1 = rtt[max(rj - 1, 0)], rtt[min(rj + 1, refine - 1)]
+        return best
+
+    def __str__(self):
+        lines = ['departures: [%.1f : %.1f] s, %d' % (self.departures[0], self.departures[-1], len(self.departures)),
+                 'transfers:  [%.1f : %.1f] s, %d' % (self.transfers[0], self.transfers[-1], len(self.transfers))]
+        lines += ['minimum: start %.2f s, transfer %.2f s, dV %.3f m/s' % m for m in self.minima]
+        return '\n'.join(lines)
+
+    def plot(self, overlay=None, levels=50):
+        """
+        :param overlay: optional (startT, transfer) arrays of the points chosen
+        by the rendezvous optimizers to be drawn over the plot
+        """
+        plt.contourf(self.departures, self.transfers, self.dV.T, levels)
+        plt.colorbar(label='dV (m/s)')
+        if self.minima:
+            m = np.array(self.minima)
+            plt.plot(m[:, 0], m[:, 1], 'rx')
+        if overlay is not None:
+            plt.plot(overlay[0], overlay[1], 'w.-')
+        plt.xlabel('departure time (s)')
+        plt.ylabel('transfer time (s)')
+        plt.show()
+
+
+if __name__ == '__main__':
+    mu = 3531600000000.0
+    chaser = Orbit((314495.948447142, 650730.150160414, 0), (-1800.99971342087, 1379.68533771485, 0), mu)
+    target = Orbit((454949.7854, 515180.6808, 0), (-1600, 1412.9, 0), mu)
+    pc = Porkchop(chaser, target, cache_dir='porkchop-cache', processes=4)
+    pc.compute(np.arange(0, 6000, 20), np.arange(300, 4000, 20))
+    print(pc)
+    pc.plot()
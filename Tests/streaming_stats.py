@@ -0,0 +1,165 @@
+from __future__ import print_function
+import numpy as np
+
+
+class StreamingStats(object):
+    """
+    One-pass statistics of many columns computed chunk by chunk with bounded memory.
+    Moments are combined with the parallel Welford (Chan et al.) formulas;
+    quantiles and histograms come from a fine fixed-bin histogram of every
+    column whose range doubles, merging pairs of bins, when new values
+    fall outside of it. NaNs are ignored.
+    """
+
+    def __init__(self, columns, bins=2048):
+        """
+        :param columns: names of the columns
+        :param bins: number of the bins of the internal histograms; the
+        quantiles are accurate to the range of the column divided by bins / 2
+        """
+        self.columns = list(columns)
+        C = len(self.columns)
+        self.bins = -(-bins // 4) * 4
+        self.count = np.zeros(C)
+        self.sum = np.zeros(C)
+        self.mean = np.zeros(C)
+        self.M2 = np.zeros(C)
+        self.M3 = np.zeros(C)
+        self.min = np.full(C, np.inf)
+        self.max = np.full(C, -np.inf)
+        self._center = None
+        self._half = None
+        self._hist = np.zeros((C, self.bins))
+
+    @classmethod
+    def from_chunks(cls, chunks, columns=None, **kwargs):
+        """
+        :param chunks: a DataFrame or an iterable of DataFrames
+        (e.g. loadCSV with chunksize)
+        """
+        if hasattr(chunks, 'columns'): chunks = [chunks]
+        st = None
+        for chunk in chunks:
+            if st is None: st = cls(chunk.columns if columns is None else columns, **kwargs)
+            st.update(chunk)
+        return st
+
+    def update(self, chunk):
+        """:param chunk: (N, C) array or a DataFrame with the columns"""
+        if hasattr(chunk, 'columns'): chunk = chunk[self.columns].values
+        x = np.asarray(chunk, dtype=float)
+        if x.ndim == 1: x = x[:, None]
+        valid = ~np.isnan(x)
+        n = valid.sum(axis=0).astype(float)
+        if not n.any(): return
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s = np.where(valid, x, 0).sum(axis=0)
+            mean = np.where(n > 0, s / n, 0)
+            d = np.where(valid, x - mean, 0)
+            M2 = (d * d).sum(axis=0)
+            M3 = (d * d * d).sum(axis=0)
+            # combine with the accumulated moments
+            na, nb = self.count, n
+            N = na + nb
+            delta = mean - self.mean
+            self.M3 = np.where(N > 0, self.M3 + M3 + delta ** 3 * na * nb * (na - nb) / (N * N) +
+                               3 * delta * (na * M2 - nb * self.M2) / N, 0)
+            self.M2 = np.where(N > 0, self.M2 + M2 + delta * delta * na * nb / N, 0)
+            self.mean = np.where(N > 0, self.mean + delta * nb / N, 0)
+        self.count = N
+        self.sum += s
+        self.min = np.fmin(self.min, np.nanmin(np.where(valid, x, np.inf), axis=0))
+        self.max = np.fmax(self.max, np.nanmax(np.where(valid, x, -np.inf), axis=0))
+        self._update_hist(x, valid)
+
+    def _update_hist(self, x, valid):
+        K = self.bins
+        if self._center is None:
+            finite = np.isfinite(self.min)
+            self._center = np.where(finite, (self.min + self.max) / 2, 0)
+            self._half = np.where(finite, np.maximum((self.max - self.min) / 2 * (1 + 1e-9), 1e-12), 1)
+        # double the ranges that do not cover the new values
+        for j in range(len(self.columns)):
+            while (self.min[j] < self._center[j] - self._half[j] or
+                   self.max[j] > self._center[j] + self._half[j]):
+                h = self._hist[j]
+                merged = h[0::2] + h[1::2]
+                h[:] = 0
+                h[K // 4:K // 4 + K // 2] = merged
+                self._half[j] *= 2
+        lo = self._center - self._half
+        width = 2 * self._half / K
+        with np.errstate(invalid='ignore'):
+            idx = np.clip(((x - lo) / width).astype(int), 0, K - 1)
+        idx += np.arange(len(self.columns)) * K
+        self._hist += np.bincount(idx[valid], minlength=K * len(self.columns)).reshape(self._hist.shape)
+
+    def _edges(self, j):
+        lo = self._center[j] - self._half[j]
+        return np.linspace(lo, lo + 2 * self._half[j], self.bins + 1)
+
+    @property
+    def var(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.M2 / self.count
+
+    @property
+    def std(self): return np.sqrt(self.var)
+
+    @property
+    def sem(self):
+        """standard error of the mean (ddof=1)"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.M2 / (self.count - 1) / self.count)
+
+    @property
+    def skewness(self):
+        """biased sample skewness, as scipy.stats.describe"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.count) * self.M3 / self.M2 ** 1.5
+
+    def quantile(self, q):
+        """:return: (C,) array of the q quantiles of the columns"""
+        res = np.full(len(self.columns), np.nan)
+        for j in range(len(self.columns)):
+            if not self.count[j]: continue
+            cdf = np.concatenate([[0], np.cumsum(self._hist[j])]) / self.count[j]
+            res[j] = np.clip(np.interp(q, cdf, self._edges(j)), self.min[j], self.max[j])
+        return res
+
+    @property
+    def median(self): return self.quantile(0.5)
+
+    def histogram(self, j, bins=10):
+        """
+        Histogram of the column j over [min, max], rebinned from the
+        internal one assuming uniform values within its bins.
+        :return: density, edges
+        """
+        edges = np.linspace(self.min[j], self.max[j], bins + 1)
+        cdf = np.concatenate([[0], np.cumsum(self._hist[j])])
+        counts = np.diff(np.interp(edges, self._edges(j), cdf))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return counts / self.count[j] / np.diff(edges), edges
+
+    def report(self, columns=None, bins=10):
+        """:return: text summary of the columns in the format of analyze_csv.describe"""
+        lines = []
+        median = self.median
+        for k in (self.columns if columns is None else columns):
+            j = self.columns.index(k)
+            lines += ['%s:' % k,
+                      '   len:     %d' % self.count[j],
+                      '   sum:     %s' % self.sum[j],
+                      '   min-max: (%s, %s)' % (self.min[j], self.max[j]),
+                      '   mean:    %s' % self.mean[j],
+                      '   median:  %s' % median[j],
+                      '   std:     %s' % self.std[j],
+                      '   sem:     %s' % self.sem[j],
+                      '   skew:    %s' % self.skewness[j],
+                      '   hist:   ']
+            h, e = self.histogram(j, bins)
+            for i in range(bins):
+                lines.append('[% 8.3f : % 8.3f]: %s' % (e[i], e[i + 1], "#" * int(np.nan_to_num(h[i]) * 80)))
+            lines.append('')
+        return '\n'.join(lines) + '\n'
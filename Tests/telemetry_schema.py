@@ -0,0 +1,179 @@
+from __future__ import print_function
+import re
+from collections import OrderedDict
+import numpy as np
+
+from analyze_csv import loadCSV, datafile
+from binary_log import BinaryLog, is_binary
+
+_group = re.compile(r'^(?P<prefix>[^\[\]:]*)\[(?P<items>[^\]]+)\](?P<suffix>[^:]*)(:(?P<dtype>.+))?$')
+_plain = re.compile(r'^(?P<name>[^:]+)(:(?P<dtype>.+))?$')
+
+
+class Schema(object):
+    """
+    Named, typed columns of a kind of telemetry log.
+    The columns are given by specs:
+        'name' or 'name:dtype' -- a single column;
+        'E[3]' -- a vector: Ex, Ey, Ez;
+        'err_[XYZ]' -- a vector with the component suffixes: err_X, err_Y, err_Z;
+        'dir_[xy]:f4' -- a typed vector.
+    Columns without a dtype have the default one of the schema;
+    'str' columns are text, the type of 'auto' columns is inferred by pandas.
+    """
+
+    def __init__(self, name, specs, dtype=np.float64):
+        self.name = name
+        self.columns = []
+        self.dtypes = OrderedDict()
+        self.vectors = OrderedDict()
+        for spec in specs:
+            m = _group.match(spec)
+            if m:
+                items = m.group('items')
+                items = 'xyz'[:int(items)] if items.isdigit() else items
+                names = [m.group('prefix') + c + m.group('suffix') for c in items]
+                self.vectors[m.group('prefix').rstrip('_') or m.group('suffix').lstrip('_')] = names
+                col_dtype = m.group('dtype')
+            else:
+                m = _plain.match(spec)
+                names = [m.group('name')]
+                col_dtype = m.group('dtype')
+            for n in names:
+                self.columns.append(n)
+                if col_dtype == 'str': self.dtypes[n] = str
+                elif col_dtype == 'auto': self.dtypes[n] = None
+                else: self.dtypes[n] = np.dtype(col_dtype or dtype)
+        self.text = [c for c, t in self.dtypes.items() if t is str]
+        self._kwargs = {}
+        self.read_csv_kwargs()
+
+    def __len__(self): return len(self.columns)
+
+    def __repr__(self): return 'Schema(%s, %d columns)' % (self.name, len(self.columns))
+
+    def read_csv_kwargs(self, usecols=None):
+        """
+        :return: pandas.read_csv arguments for the file of this schema;
+        built once per set of usecols and shared, so not to be modified
+        """
+        key = None if usecols is None else frozenset(usecols)
+        kwargs = self._kwargs.get(key)
+        if kwargs is None:
+            columns = self.columns if key is None else [c for c in self.columns if c in key]
+            kwargs = self._kwargs[key] = dict(
+                header=None, names=self.columns, engine='c',
+                usecols=None if key is None else columns,
+                dtype=dict((c, self.dtypes[c]) for c in columns if self.dtypes[c] is not None))
+        return kwargs
+
+    def load(self, filename, usecols=None, chunksize=None, cache=False):
+        """
+        :param usecols: column or vector names to load
+        :return: DataFrame or an iterator over DataFrames if chunksize is given
+        """
+        if usecols is not None:
+            usecols = [c for u in usecols for c in self.vectors.get(u, [u])]
+        kw = self.read_csv_kwargs(usecols)
+        return loadCSV(filename, self.columns, usecols=kw['usecols'], dtype=kw['dtype'],
+                       chunksize=chunksize, cache=cache)
+
+    def vector(self, df, name):
+        """:return: (N, k) array of the components of a vector column group"""
+        return df[self.vectors[name]].values
+
+    def matches(self, fields):
+        """:return: True if the fields of a line of a log fit this schema"""
+        if len(fields) != len(self.columns): return False
+        for f, c in zip(fields, self.columns):
+            if self.dtypes[c] is str or self.dtypes[c] is None: continue
+            try: float(f)
+            except ValueError: return False
+        return True
+
+
+schemas = OrderedDict()
+
+
+def register(schema):
+    schemas[schema.name] = schema
+    return schema
+
+
+def get_schema(name):
+    return schemas[name]
+
+
+def detect(filename):
+    """
+    Detects the schema of a log by the number of the fields of its first line
+    and by which of them are numeric; the schema of a binary log is in its header.
+    :rtype: Schema
+    """
+    if is_binary(filename):
+        return schemas[BinaryLog(filename).schema]
+    with open(datafile(filename)) as f:
+        fields = f.readline().strip().split(',')
+    found = [s for s in schemas.values() if s.matches(fields)]
+    if not found:
+        raise ValueError('No schema matches %d columns of %s' % (len(fields), filename))
+    if len(found) > 1:
+        raise ValueError('Ambiguous schema of %s: %s' % (filename, ', '.join(s.name for s in found)))
+    return found[0]
+
+
+def load(filename, schema=None, **kwargs):
+    """
+    Loads a log with the given or the detected schema.
+    :param schema: Schema, its name or None to detect it
+    :param kwargs: passed to Schema.load
+    """
+    if schema is None: schema = detect(filename)
+    elif not isinstance(schema, Schema): schema = schemas[schema]
+    return schema.load(filename, **kwargs)
+
+
+register(Schema('AttitudeControl',
+                ('Alt',
+                 'E[3]', 'S[3]', 'AV[3]', 'AM[3]', 'IN[3]', 'A[3]', 'P[3]', 'I[3]', 'D[3]',
+                 'AA[3]', 'PIf[3]', 'AAf[3]', 'SL[3]')))
+
+register(Schema('AttitudeControl-OD',
+                ('Alt',
+                 'E[3]', 'S[3]', 'AV[3]', 'IN[3]', 'A[3]', 'P[3]', 'I[3]', 'D[3]',
+                 'AA[3]', 'PIf[3]', 'AAf[3]', 'SL[3]', 'OD[3]', 'ODm[3]')))
+
+register(Schema('AttitudeControl-axes',
+                ('err_[XYZ]', 'atPID_[XYZ]', 'avEr_[XYZ]', 'av_[XYZ]', 'aa_[XYZ]',
+                 'pitch', 'roll', 'yaw')))
+
+register(Schema('AAf-curve',
+                ('axis', 'throttle', 'AA[3]', 'OD[3]', 'kD[3]', 'AAf')))
+
+register(Schema('oscillation',
+                ('tag:str', 'UT', 'ErrDeg', 'S[3]', 'AV[3]', 'dS[3]', 'P[3]')))
+
+register(Schema('VS-filtering',
+                ('AbsAlt', 'TerAlt', 'Alt', 'AltAhead', 'Err', 'VSP', 'VSF', 'MinVSF',
+                 'aV', 'rV', 'dV', 'mdTWR', 'mTWR', 'hV')))
+
+register(Schema('CDOS-search',
+                ('tag:str', 'startT', 'transfer', 'dist', 'dir_[xy]', 'dDist', 'feasible:auto', 'time')))
+
+register(Schema('CDOS-dV',
+                ('cdos_dV', 'cdos_d', 'cdos_time',
+                 'correction', 'correction_time',
+                 'cdos_ttr', 'cdos_ttr_end', 'cdos_ttr_d', 'cdos_ttr_time',
+                 'old', 'old_end', 'old_d', 'old_time',
+                 'correction_dV_diff', 'old_dV_diff',
+                 'incl',
+                 'PeR', 'ApR',
+                 'PeA_angle_before', 'PeA_angle_after',
+                 'ttr_before', 'ttr_after',
+                 'res_before', 'res_after',
+                 'signed_ttr_after',
+                 'periodT', 'periodV_before', 'periodV_after',
+                 'eccV_before', 'eccV_after', 'eccT',
+                 'enV_before', 'enV_after', 'enT',
+                 'ttr_up', 'ttr_async',
+                 'time')))
@@ -20,29 +20,51 @@ class Vessel(object):
         self.S = S
         self.mflow = mflow
         self._T2mflow = self.T/self.mflow
+        self._ttb = {}
 
     def full_thrust_velocity(self, dt):
-        return self._T2mflow*math.log(self.M/(self.M-self.mflow*dt))-self.G*dt
+        return self._T2mflow*np.log(self.M/(self.M-self.mflow*dt))-self.G*dt
 
     def full_thrust_height(self, dt):
         m1 = self.M-self.mflow*dt
-        return self._T2mflow*(m1/self.mflow*math.log(m1/self.M)+dt)-self.G*dt*dt/2
+        return self._T2mflow*(m1/self.mflow*np.log(m1/self.M)+dt)-self.G*dt*dt/2
 
     def full_thrust_ApA(self, dt):
         return self.full_thrust_velocity(dt)**2/2/self.G + self.full_thrust_height(dt)
 
-    def ttb_for_ApA(self, ApA, tol=0.01):
-        t0 = 0.0
-        t1 = 1.0
-        while self.full_thrust_ApA(t1) < ApA: t1 *= 2
-        while(t1-t0 > tol):
-            t = (t0+t1)/2.0
-            apa = self.full_thrust_ApA(t)
-            if apa > ApA: t1 = t
-            else: t0 = t
-        return (t0+t1)/2.0
-
-    def tta(self, ApA, tol=0.01):
+    def ttb_for_ApA(self, ApA, tol=1e-6):
+        """
+        Time of the full-thrust burn that raises the apoapsis to ApA.
+        Results for scalar ApA are memoized per the vessel parameters;
+        arrays of ApA are solved at once.
+        """
+        if np.ndim(ApA): return ttb_for_ApA(self.M, self.T, self.mflow, ApA, self.G, tol)
+        key = (self.M, self.T, self.mflow, ApA, tol)
+        ttb = self._ttb.get(key)
+        if ttb is None: ttb = self._ttb[key] = self._solve_ttb(ApA, tol)
+        return ttb
+
+    def _solve_ttb(self, ApA, tol, maxiter=50):
+        """Scalar version of the module-level ttb_for_ApA"""
+        if ApA <= 0: return 0.0
+        lo, hi = 0.0, self.M/self.mflow
+        a = max(self.T/self.M-self.G, 1e-6)
+        t = min(math.sqrt(2*ApA/(a*(a/self.G+1))), hi/2)
+        for _ in range(maxiter):
+            m1 = self.M-self.mflow*t
+            v = self._T2mflow*math.log(self.M/m1)-self.G*t
+            f = v*v/2/self.G+self._T2mflow*(m1/self.mflow*math.log(m1/self.M)+t)-self.G*t*t/2-ApA
+            if f < 0: lo = t
+            elif f > 0: hi = t
+            else: return t
+            d = v*self.T/m1/self.G
+            t1 = t-f/d if d > 0 else lo
+            if not lo < t1 < hi: t1 = (lo+hi)/2
+            if abs(t1-t) < tol: return t1
+            t = t1
+        return t
+
+    def tta(self, ApA, tol=1e-6):
         ttb = self.ttb_for_ApA(ApA, tol)
         return self.full_thrust_velocity(ttb)/self.G+ttb
 
@@ -84,7 +106,12 @@ class Vessel(object):
             if atm: v -= (atm(H) * (v**2) * self.Cd * self.S) / 2 / m * dt
         return H
 
-    def simulate(self, ApA, dt=0.01, atm=None):
+    def simulate(self, ApA, dt=0.01, atm=None, predictor=None):
+        """
+        :param predictor: function (m, h, v) -> apoapsis;
+        ApoapsisPredictor of the vessel and atm by default
+        """
+        if predictor is None: predictor = ApoapsisPredictor(self, atm)
         t = [0.0]
         v = [0.0]
         h = [0.0]
@@ -99,7 +126,7 @@ class Vessel(object):
                     thrust = False
                     continue
                 m -= dm
-                apa = self.freefall(m, h[-1], v[-1], atm, dt * 4)
+                apa = predictor(m, h[-1], v[-1])
                 dapa = ApA-apa
                 vv = dapa/max(v[-1],1)
                 hv = hmove/max(dapa, 60)*60*math.sqrt(min(max(h[-1]/70000, 0), 1))*min((apa-h[-1])/100, 1)
@@ -118,12 +145,132 @@ class Vessel(object):
             t.append(t[-1]+dt)
         return t, h, v, Tf
 
+class ApoapsisPredictor(object):
+    """
+    Apoapsis of the vertical freefall of a vessel from (h, v) with gravity
+    and drag, found without integrating the trajectory. With u = v^2/2 the
+    freefall equation is linear in the height:
+        du/dh = -g(h) - 2k*rho(h)*u,  k = Cd*S/2m,
+    so the apoapsis H solves
+        Q(H) - Q(h) = u*exp(2k*P(h)),
+    where P is the integral of rho and Q the integral of g*exp(2k*P).
+    P is tabulated once up to the top of the atmosphere, above which the
+    vacuum solution is used; Q is tabulated for k on a logarithmic grid
+    with the step rtol, and the apoapsis is interpolated between the two
+    nearest tables, which are cached. For the drag too strong for the
+    tables the density and gravity are taken constant near h.
+    """
+
+    def __init__(self, vessel, atm=None, top=100000.0, dh=10.0, rtol=0.01):
+        """
+        :param atm: density as a function of height; vacuum if None
+        :param top: the height above which the density is neglected
+        :param dh: the step of the tables
+        """
+        self.vessel = vessel
+        self.atm = atm
+        self.top = top
+        self.dh = dh
+        self._lk = math.log(1+rtol)
+        self._Q = {}
+        if atm:
+            self.h = np.arange(0, top+dh/2, dh)
+            rho = np.array([atm(x) for x in self.h])
+            self.P = np.concatenate([[0], np.cumsum((rho[1:]+rho[:-1])/2*dh)])
+            self.g = vessel.StG(self.h)
+
+    def _table(self, i):
+        Q = self._Q.get(i)
+        if Q is None:
+            f = self.g*np.exp(2*math.exp(i*self._lk)*self.P)
+            Q = self._Q[i] = np.concatenate([[0], np.cumsum((f[1:]+f[:-1])/2*self.dh)])
+        return Q
+
+    def vacuum(self, h, u):
+        """:return: apoapsis of the freefall from height h with v^2/2 = u in vacuum"""
+        inv = 1.0/(self.vessel.R+h) - u/self.vessel.cG
+        return 1.0/inv-self.vessel.R if inv > 0 else float('inf')
+
+    def _apoapsis(self, i, h, u):
+        Q = self._table(i)
+        E = math.exp(2*math.exp(i*self._lk)*self.P[-1])
+        target = np.interp(h, self.h, Q) + u*math.exp(2*math.exp(i*self._lk)*np.interp(h, self.h, self.P))
+        if target <= Q[-1]: return np.interp(target, Q, self.h)
+        return self.vacuum(self.top, (target-Q[-1])/E)
+
+    def __call__(self, m, h, v):
+        if v <= 0: return h
+        u = v*v/2
+        k = self.vessel.Cd*self.vessel.S/2/m
+        if not self.atm or k <= 0 or h >= self.top: return self.vacuum(h, u)
+        if 2*k*self.P[-1] > 600:
+            kr = 2*k*self.atm(h)
+            g = self.vessel.StG(h)
+            return h+math.log1p(kr*u/g)/kr if kr > 0 else self.vacuum(h, u)
+        x = math.log(k)/self._lk
+        i = int(math.floor(x))
+        w = x-i
+        return (1-w)*self._apoapsis(i, h, u) + w*self._apoapsis(i+1, h, u)
+
+def ttb_for_ApA(M, T, mflow, ApA, G=Vessel.G, tol=1e-6, maxiter=50):
+    """
+    Vectorized time of the full-thrust burn that raises the apoapsis to ApA.
+    All the arguments broadcast, so it solves for arrays of vessels and targets at once.
+    ApA(t) = v^2/2G + h grows monotonically with dApA/dt = v*(T/m1)/G,
+    so Newton steps are taken with this derivative, safeguarded by the bracket
+    [0, M/mflow) of the burn time: steps leaving the bracket are replaced by bisection.
+    :param tol: the last Newton step at which the iteration stops, s
+    """
+    M, T, mflow, ApA = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (M, T, mflow, ApA)])
+    c = T/mflow
+    lo = np.zeros(M.shape)
+    hi = M/mflow
+    # initial guess: constant acceleration of the full mass
+    a = np.maximum(T/M-G, 1e-6)
+    t = np.minimum(np.sqrt(2*np.maximum(ApA, 0)/(a*(a/G+1))), hi/2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(maxiter):
+            m1 = M-mflow*t
+            v = c*np.log(M/m1)-G*t
+            h = c*(m1/mflow*np.log(m1/M)+t)-G*t*t/2
+            f = v*v/2/G+h-ApA
+            lo = np.where(f < 0, t, lo)
+            hi = np.where(f > 0, t, hi)
+            t1 = t-f/(v*T/m1/G)
+            t1 = np.where((t1 > lo) & (t1 < hi), t1, (lo+hi)/2)
+            done = np.abs(t1-t) < tol
+            t = t1
+            if done.all(): break
+    t = np.where(ApA > 0, t, 0.0)
+    return t if t.ndim else float(t)
+
+def launch_table(vessels, ApAs):
+    """
+    :param vessels: list of Vessels
+    :param ApAs: target apoapses
+    :return: DataFrame with a row per vessel and target: vessel, ApA, TTB, TTA, V max, end mass
+    """
+    M, T, mflow = (np.array([getattr(vsl, p) for vsl in vessels])[:, None] for p in ('M', 'T', 'mflow'))
+    ApA = np.asarray(ApAs, dtype=float)[None, :]
+    ttb = ttb_for_ApA(M, T, mflow, ApA, Vessel.G)
+    m1 = M-mflow*ttb
+    vmax = T/mflow*np.log(M/m1)-Vessel.G*ttb
+    shape = ttb.shape
+    return pd.DataFrame({'vessel': np.repeat([str(vsl) for vsl in vessels], shape[1]),
+                         'ApA': np.broadcast_to(ApA, shape).ravel(),
+                         'TTB': ttb.ravel(),
+                         'TTA': (vmax/Vessel.G+ttb).ravel(),
+                         'Vmax': vmax.ravel(),
+                         'EndMass': m1.ravel()},
+                        columns=['vessel', 'ApA', 'TTB', 'TTA', 'Vmax', 'EndMass'])
+
 if __name__ == '__main__':
     # TCA Test 6.RendezvouAutopilot: T 928.8749*0.919181502342862, M 67.045, mflow 0.2814892
     dt = 0.5
     ApA = 100000
 
     vsl = Vessel(67.045, 928.8749*0.9, 0.2814892, 0.0006, 44.19966)
+    print launch_table([vsl], np.arange(70000, 250001, 10000)).to_string()
 
     # ttb = vsl.ttb_for_ApA(ApA)
     # time = np.arange(0, vsl.tta(ApA)+dt, dt)
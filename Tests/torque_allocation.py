@@ -0,0 +1,373 @@
+from __future__ import print_function
+import numpy as np
+import matplotlib.pyplot as plt
+
+from common import clamp01, plt_show_maxed, vec, vec6
+
+
+def _hull_vertices(points, tol=1e-9):
+    """
+    Vertices of the convex hull of a set of 3D points.
+    Degenerate (planar, linear) sets are handled in their own subspace.
+    """
+    from scipy.spatial import ConvexHull
+    center = points.mean(axis=0)
+    _u, s, basis = np.linalg.svd(points - center, full_matrices=False)
+    rank = int(np.sum(s > tol * max(s[0], 1.0))) if s.size else 0
+    if rank == 0: return points[:1]
+    proj = (points - center).dot(basis[:rank].T)
+    if rank == 1: return points[[np.argmin(proj[:, 0]), np.argmax(proj[:, 0])]]
+    return points[ConvexHull(proj).vertices]
+
+
+class AttainableSet(object):
+    """
+    Attainable moment set of a craft: the zonotope base + A.[0,1]^N
+    swept by the engine limits. Degenerate sets are represented
+    in their own subspace.
+    """
+
+    def __init__(self, base, A, tol=1e-6):
+        from scipy.spatial import ConvexHull
+        points = base[None, :]
+        for a in A.T:
+            if not np.any(a): continue
+            points = np.vstack([points, points + a])
+            if len(points) > 64: points = _hull_vertices(points)
+        self.vertices = _hull_vertices(points)
+        self.center = self.vertices.mean(axis=0)
+        _u, s, basis = np.linalg.svd(self.vertices - self.center, full_matrices=False)
+        self.rank = int(np.sum(s > 1e-9 * max(s[0], 1.0))) if s.size else 0
+        self.basis = basis[:self.rank]
+        self.tol = tol * max(np.abs(self.vertices).max(), 1.0)
+        if self.rank == 1:
+            proj = (self.vertices - self.center).dot(self.basis.T)
+            self.equations = np.array([[1.0, -proj.max()], [-1.0, proj.min()]])
+        elif self.rank > 1:
+            self.equations = ConvexHull((self.vertices - self.center).dot(self.basis.T)).equations
+        else: self.equations = np.zeros((0, 1))
+
+    def contains(self, demands):
+        """:return: boolean array of the demands that lie inside the set"""
+        D = np.asarray(demands, dtype=float).reshape(-1, 3) - self.center
+        proj = D.dot(self.basis.T)
+        off = np.linalg.norm(D - proj.dot(self.basis), axis=1)
+        inside = off <= self.tol
+        if self.rank:
+            inside &= np.all(proj.dot(self.equations[:, :-1].T) + self.equations[:, -1] <= self.tol, axis=1)
+        return inside
+
+
+class CraftModel(object):
+    """
+    Torque model of a craft compiled from the list of engines.
+    The torque produced with limits L is base + A.L (a matrix-vector product);
+    the matrices, vec6 clamp and attainable set are cached per vK.
+    """
+
+    def __init__(self, engines):
+        self.torque = np.array([e.torque.v for e in engines], dtype=float)
+        self.min_thrust = np.array([e.min_thrust for e in engines], dtype=float)
+        self.max_thrust = np.array([e.max_thrust for e in engines], dtype=float)
+        self.maneuver = np.array([e.maneuver for e in engines], dtype=bool)
+        self.manual = np.array([e.manual for e in engines], dtype=bool)
+        self.ratio = np.array([clamp01(1.0 - abs(e.pos.norm * e.dir.norm)) ** 0.1
+                               for e in engines], dtype=float)
+        # torques at minimum thrust (maximum for manual engines) and the span of each engine
+        self.T0 = (self.torque * np.where(self.manual, self.max_thrust, self.min_thrust)[:, None]).T
+        self.Tspan = (self.torque * np.where(self.manual, 0.0, self.max_thrust - self.min_thrust)[:, None]).T
+        self.vK_min = self._vK_min()
+        self._cache = {}
+
+    def __len__(self): return len(self.torque)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_cache'] = {}
+        return state
+
+    def _vK_min(self):
+        """Minimal vK needed to compensate the torque imbalance at minimal thrust"""
+        ti_min = self.T0.sum(axis=1)
+        if np.linalg.norm(ti_min) > 0:
+            anti = self.torque.dot(ti_min) < 0
+            anti_ti_min = self.max_thrust[anti].dot(self.torque[anti])
+            if np.linalg.norm(anti_ti_min) > 0:
+                return clamp01(np.linalg.norm(ti_min) / np.linalg.norm(anti_ti_min) * 1.2)
+        return 0.0
+
+    def _cached(self, key, vK, compute):
+        k = (key, float(vK))
+        val = self._cache.get(k)
+        if val is None:
+            val = self._cache[k] = compute()
+        return val
+
+    def vsf(self, vK):
+        return np.where(self.maneuver, 1.0, np.clip(vK, 0.0, 1.0))
+
+    def matrices(self, vK):
+        """
+        :return: base (3,), A (3, N) such that the torque of the craft
+        with engine limits L is base + A.L
+        """
+        return self._cached('matrices', vK, lambda: (self.T0.sum(axis=1), self.Tspan * self.vsf(vK)))
+
+    def current(self, vK):
+        """:return: (N, 3) torques of the engines at full limits"""
+        def compute():
+            base, A = self.matrices(vK)
+            return self.T0.T + A.T
+        return self._cached('current', vK, compute)
+
+    def current_dir(self, vK):
+        def compute():
+            current = self.current(vK)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return current / np.linalg.norm(current, axis=1)[:, None]
+        return self._cached('current_dir', vK, compute)
+
+    def clamp(self, vK):
+        """:return: positive and negative (3,) bounds of the vec6 torque clamp"""
+        def compute():
+            current = self.current(vK)
+            return np.clip(current, 0, None).sum(axis=0), np.clip(current, None, 0).sum(axis=0)
+        return self._cached('clamp', vK, compute)
+
+    def vec6(self, vK):
+        c = vec6()
+        c.positive, c.negative = (vec.from_array(v) for v in self.clamp(vK))
+        return c
+
+    def clamp_demands(self, demands, vK):
+        positive, negative = self.clamp(vK)
+        D = np.asarray(demands, dtype=float).reshape(-1, 3)
+        return np.where(D >= 0, np.minimum(D, positive), np.maximum(D, negative))
+
+    def attainable(self, vK):
+        """:rtype: AttainableSet"""
+        return self._cached('attainable', vK, lambda: AttainableSet(*self.matrices(vK)))
+
+    def torques(self, limits, vK, mask=None):
+        """(M, 3) torques produced with (M, N) limits; if mask is given, only by the masked engines"""
+        base, A = self.matrices(vK)
+        if mask is None: return base + limits.dot(A.T)
+        return mask.dot(self.T0.T) + (mask * limits).dot(A.T)
+
+
+_craft_cache = {}
+
+
+def _craft_signature(engines):
+    return tuple((tuple(e.torque.v), tuple(e.pos.v), tuple(e.dir.v),
+                  e.min_thrust, e.max_thrust, e.maneuver, e.manual) for e in engines)
+
+
+def compile_craft(engines):
+    """
+    :return: CraftModel of the engines; the model is reused
+    until any of the engines parameters change.
+    :rtype: CraftModel
+    """
+    if isinstance(engines, CraftModel): return engines
+    key = _craft_signature(engines)
+    model = _craft_cache.get(key)
+    if model is None:
+        model = _craft_cache[key] = CraftModel(engines)
+    return model
+
+
+def _angle(a, b):
+    """Row-wise vec.angle; radians, NaN where either vector is zero"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.arccos(np.einsum('ij,ij->i', a, b) /
+                         (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)))
+
+
+def _solve(craft, demands, vK, eps, maxI):
+    """
+    The same iterative algorithm as sim_Attitude.optR,
+    run simultaneously for all the demands (lanes).
+    Each lane stops independently when optR would have stopped.
+    :type craft: CraftModel
+    """
+    D = np.asarray(demands, dtype=float).reshape(-1, 3)
+    N = D.shape[0]
+    vK = max(vK, craft.vK_min)
+    current_dir = craft.current_dir(vK)
+    d = craft.clamp_demands(D, vK)
+    d_zero = np.linalg.norm(d, axis=1) == 0
+    no_manual = not craft.manual.any()
+    adjustable = ~craft.manual
+    man = craft.maneuver & ~craft.manual
+    ratio = craft.ratio
+
+    limits = np.tile(np.where(craft.maneuver, 0.0, 1.0), (N, 1))
+    best_limits = limits.copy()
+    best_error = np.full(N, -1.0)
+    best_angle = np.full(N, -1.0)
+    prev_error = np.zeros(N)
+    iterations = np.zeros(N, dtype=int)
+    imb = craft.torques(limits, vK)
+    lanes = np.arange(N)
+    for i in range(maxI):
+        if not lanes.size: break
+        L = limits[lanes]
+        t = imb[lanes]
+        ld = d[lanes]
+        error = np.linalg.norm(t - ld, axis=1)
+        angle = np.where(d_zero[lanes], 0.0, _angle(t, ld))
+        be = best_error[lanes]
+        ba = best_angle[lanes]
+        better = ((angle <= 0) & (error < be)) | (error + angle < be + ba) | (ba < 0)
+        best_error[lanes[better]] = error[better]
+        best_angle[lanes[better]] = angle[better]
+        best_limits[lanes[better]] = L[better]
+        iterations[lanes] = i + 1
+        done = error < eps
+        if i > 0: done |= np.abs(error - prev_error[lanes]) < eps / 10.0
+        prev_error[lanes] = error
+        go = ~done
+        lanes, L, t, ld = lanes[go], L[go], t[go], ld[go]
+        if not lanes.size: break
+        if no_manual:
+            mlim = L.max(axis=1)
+            L = np.where(mlim[:, None] > 0, np.clip(L / np.where(mlim > 0, mlim, 1)[:, None], 0, 1), L)
+        # one step of sim_Attitude.opt
+        target = ld - t
+        tm = np.linalg.norm(target, axis=1)
+        lt = -target.dot(current_dir.T) / tm[:, None] * ratio
+        lt[:, craft.manual] = 0
+        comp = lt > 0
+        to_man = ~comp & man
+        L = np.where(to_man & (L == 0), eps, L)
+        lt = np.where(~comp & ~man, 0.0, lt)
+        compm = np.linalg.norm(craft.torques(L, vK, comp), axis=1)
+        manm = np.linalg.norm(craft.torques(L, vK, to_man), axis=1)
+        ok = ~((compm < eps) & (manm == 0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            limits_norm = np.clip(tm / compm, 0, 1)
+            man_norm = np.clip(tm / manm, 0, 1)
+        norm = np.where(lt < 0, man_norm[:, None], limits_norm[:, None])
+        L = np.where(adjustable, np.clip(L * (1.0 - lt * norm), 0, 1), L)
+        limits[lanes] = L
+        lanes = lanes[ok]
+        imb[lanes] = craft.torques(limits[lanes], vK)
+    return best_error, best_angle, best_limits, iterations, d
+
+
+def _solve_chunk(args):
+    return _solve(*args)
+
+
+class BatchResult(object):
+    """Results of the torque allocation for every demand of a batch"""
+
+    def __init__(self, demands, clamped, attainable, errors, angles, limits, iterations):
+        self.demands = demands
+        self.clamped = clamped
+        self.attainable = attainable
+        self.errors = errors
+        self.angles = angles
+        self.limits = limits
+        self.iterations = iterations
+
+    @property
+    def rel_errors(self):
+        """torque error relative to the clamped demand magnitude"""
+        dm = np.linalg.norm(self.clamped, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(dm > 0, self.errors / dm, 0.0)
+
+    def failed(self, max_error=0.1, max_angle=np.radians(10)):
+        """
+        :param max_error: maximum acceptable relative torque error
+        :param max_angle: maximum acceptable direction error, radians
+        :return: boolean array of demands the allocation failed to satisfy
+        """
+        with np.errstate(invalid='ignore'):
+            return ~((self.rel_errors <= max_error) & (self.angles <= max_angle))
+
+    def failure_map(self, bins=(36, 18), **kwargs):
+        """
+        Failure rate binned over the directions of the demands.
+        :param bins: number of (azimuth, elevation) bins
+        :param kwargs: passed to failed()
+        :return: rate, azimuth bin edges, elevation bin edges;
+        rate is NaN for bins without demands
+        """
+        dm = np.linalg.norm(self.demands, axis=1)
+        nz = dm > 0
+        D = self.demands[nz] / dm[nz, None]
+        az = np.arctan2(D[:, 1], D[:, 0])
+        el = np.arcsin(np.clip(D[:, 2], -1, 1))
+        rng = [[-np.pi, np.pi], [-np.pi / 2, np.pi / 2]]
+        total, az_edges, el_edges = np.histogram2d(az, el, bins, rng)
+        failed = self.failed(**kwargs)[nz]
+        fails = np.histogram2d(az[failed], el[failed], bins, rng)[0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rate = np.where(total > 0, fails / total, np.nan)
+        return rate, az_edges, el_edges
+
+    def __str__(self):
+        failed = self.failed()
+        return '\n'.join([
+            'demands:    %d' % len(self.demands),
+            'failed:     %d (%.2f%%)' % (failed.sum(), failed.mean() * 100 if failed.size else 0),
+            'attainable: %d, failed %d' % (self.attainable.sum(), (failed & self.attainable).sum()),
+            'error:      mean %f, max %f' % (np.nanmean(self.errors), np.nanmax(self.errors)),
+            'rel error:  mean %f, max %f' % (np.nanmean(self.rel_errors), np.nanmax(self.rel_errors)),
+            'angle:      mean %f, max %f rad' % (np.nanmean(self.angles), np.nanmax(self.angles)),
+            'iterations: mean %.1f, max %d' % (self.iterations.mean(), self.iterations.max())])
+
+
+def random_demands(num, magnitude=100.0, seed=None):
+    """Uniformly distributed demands inside a [-magnitude, magnitude] cube"""
+    rnd = np.random.RandomState(seed)
+    return rnd.uniform(-magnitude, magnitude, (num, 3))
+
+
+def optR_batch(engines, demands, vK=1.0, eps=0.1, maxI=500, chunk=10000, processes=1):
+    """
+    Solves torque allocation of sim_Attitude.optR for a whole (N, 3) array
+    of demands. The lanes are vectorized; large batches are split into chunks
+    which may be solved in parallel.
+    :param engines: list of MiscCalculations.engine or a CraftModel
+    :param demands: (N, 3) array-like; vec objects are accepted too
+    :param chunk: maximum number of demands solved by a single call
+    :param processes: number of worker processes; 1 to solve in this process
+    :rtype: BatchResult
+    """
+    D = np.array([getattr(d, 'v', d) for d in demands], dtype=float).reshape(-1, 3)
+    craft = compile_craft(engines)
+    jobs = [(craft, D[i:i + chunk], vK, eps, maxI) for i in range(0, len(D), chunk)]
+    if processes > 1 and len(jobs) > 1:
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        try: parts = pool.map(_solve_chunk, jobs)
+        finally: pool.close()
+    else: parts = [_solve_chunk(j) for j in jobs]
+    errors, angles, limits, iterations, clamped = (np.concatenate(p) for p in zip(*parts))
+    attainable = craft.attainable(max(vK, craft.vK_min)).contains(clamped)
+    return BatchResult(D, clamped, attainable, errors, angles, limits, iterations)
+
+
+def plot_batch(result, title='', **kwargs):
+    rate, az, el = result.failure_map(**kwargs)
+    D = result.demands / np.linalg.norm(result.demands, axis=1)[:, None] * 100
+    plt.subplot(2, 2, 1)
+    plt.plot(result.angles, result.rel_errors * 100, '.')
+    plt.xlabel('angle (rad)')
+    plt.ylabel('torque error (%)')
+    if title: plt.title(title)
+    for i, axis in enumerate('xy'):
+        plt.subplot(2, 2, 2 + i)
+        plt.plot(D[:, i], result.angles, '.')
+        plt.xlabel('%s %%' % axis)
+        plt.ylabel('angle (rad)')
+    plt.subplot(2, 2, 4)
+    plt.pcolormesh(np.degrees(az), np.degrees(el), rate.T, vmin=0, vmax=1)
+    plt.colorbar(label='failure rate')
+    plt.xlabel('demand azimuth (deg)')
+    plt.ylabel('demand elevation (deg)')
+    plt_show_maxed()